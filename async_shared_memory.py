@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from metrics import timed
+from shared_memory import (DEFAULT_LOG_ENCODING, DEFAULT_MAX_LOG_ENTRIES, DEFAULT_MEMORY_TTL, DEFAULT_REDIS_URL,
+                           MemoryCodec, binary_client)
+from tracing import get_logger, trace_event
+
+logger = get_logger('memory.async')
+
+# Upper bound on connections per loop; extra coroutines wait for a free connection
+MAX_CONNECTIONS = 64
+
+# Async connections are bound to the event loop that created them, so pools
+# and shared memories are kept per running loop
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, aioredis.BlockingConnectionPool]]" = weakref.WeakKeyDictionary()
+_shared: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncSharedMemory]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_client(redis_url: str = DEFAULT_REDIS_URL) -> aioredis.Redis:
+    """Return an asyncio client backed by the running loop's connection pool for redis_url"""
+    pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(redis_url)
+    if pool is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            redis_url, max_connections=MAX_CONNECTIONS, decode_responses=True
+        )
+        pools[redis_url] = pool
+    return aioredis.Redis(connection_pool=pool)
+
+
+def get_async_shared_memory(redis_url: str = DEFAULT_REDIS_URL) -> 'AsyncSharedMemory':
+    """Return the running loop's AsyncSharedMemory for redis_url, creating it on first use"""
+    shared = _shared.setdefault(asyncio.get_running_loop(), {})
+    memory = shared.get(redis_url)
+    if memory is None:
+        memory = shared[redis_url] = AsyncSharedMemory(redis_url)
+    return memory
+
+
+class AsyncSharedMemory(MemoryCodec):
+    """asyncio counterpart of SharedMemory with the same key layout and encoding"""
+
+    def __init__(self, redis_url: str = DEFAULT_REDIS_URL, client: Optional[aioredis.Redis] = None,
+                 ttl: int = DEFAULT_MEMORY_TTL, max_log_entries: int = DEFAULT_MAX_LOG_ENTRIES,
+                 log_encoding: str = DEFAULT_LOG_ENCODING):
+        self.redis = client if client is not None else get_async_redis_client(redis_url)
+        self.log_redis = binary_client(self.redis, aioredis.Redis)
+        self._configure_retention(ttl, max_log_entries, log_encoding)
+        trace_event(logger, 'memory.init', backend='redis.asyncio', ttl=ttl, max_log_entries=max_log_entries,
+                    log_encoding=log_encoding)
+
+    async def _trace_memory_state(self, operation: str, conversation_id: str) -> None:
+        """Dump the full conversation state, fetched only when DEBUG tracing is enabled"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        context, history = await self._fetch_state(conversation_id)
+        trace_event(logger, 'memory.state', logging.DEBUG, operation=operation,
+                    conversation_id=conversation_id, context=context,
+                    logs=[self._decode_entry(entry) for entry in history])
+
+    async def _fetch_state(self, conversation_id: str) -> Tuple[Optional[Dict[str, Any]], list]:
+        """Fetch context and processing history in a single round trip"""
+        pipe = self.log_redis.pipeline(transaction=False)
+        pipe.hgetall(self._context_key(conversation_id))
+        pipe.lrange(self._logs_key(conversation_id), 0, -1)
+        context_hash, history = await pipe.execute()
+        return self._decode_fields(context_hash) or None, history
+
+    async def _migrate_legacy_context(self, key: str) -> None:
+        """Convert a context stored as one JSON string into a hash"""
+        async def convert(pipe: aioredis.client.Pipeline) -> None:
+            if await pipe.type(key) != 'string':
+                return
+            context = json.loads(await pipe.get(key))
+            pipe.multi()
+            pipe.delete(key)
+            if context:
+                pipe.hset(key, mapping=self._encode_fields(context))
+
+        await self.redis.transaction(convert, key)
+        trace_event(logger, 'context.migrate', key=key)
+
+    async def _with_hash_context(self, key: str, operation):
+        """Run a hash operation, migrating a pre-hash JSON context on WRONGTYPE"""
+        try:
+            return await operation()
+        except redis.ResponseError as e:
+            if 'WRONGTYPE' not in str(e):
+                raise
+            await self._migrate_legacy_context(key)
+            return await operation()
+
+    async def _hset(self, key: str, mapping: Dict[str, str]) -> None:
+        """HSET plus expiry in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        self._queue_expire(pipe, key)
+        await pipe.execute()
+
+    @timed('memory.store_context')
+    async def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
+        """Store context for a conversation, replacing any existing fields"""
+        data['timestamp'] = self._timestamp()
+        key = self._context_key(conversation_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode_fields(data))
+        self._queue_expire(pipe, key)
+        await pipe.execute()
+        trace_event(logger, 'context.store', conversation_id=conversation_id, fields=len(data))
+        await self._trace_memory_state("Store Context", conversation_id)
+
+    @timed('memory.get_context')
+    async def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve context for a conversation"""
+        key = self._context_key(conversation_id)
+        context = self._decode_fields(await self._with_hash_context(key, lambda: self.redis.hgetall(key))) or None
+        trace_event(logger, 'context.get', logging.DEBUG, conversation_id=conversation_id,
+                    found=len(context) if context else 0)
+        return context
+
+    @timed('memory.get_context_fields')
+    async def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        """Retrieve only the named context fields; missing fields are omitted"""
+        if not fields:
+            return {}
+        key = self._context_key(conversation_id)
+        values = await self._with_hash_context(key, lambda: self.redis.hmget(key, fields))
+        return {field: json.loads(value) for field, value in zip(fields, values) if value is not None}
+
+    @timed('memory.update_context')
+    async def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        """Update existing context with new information"""
+        if not updates:
+            return
+        key = self._context_key(conversation_id)
+        mapping = self._encode_fields(updates)
+        await self._with_hash_context(key, lambda: self._hset(key, mapping))
+        trace_event(logger, 'context.update', conversation_id=conversation_id, fields=list(updates))
+        await self._trace_memory_state("Update Context", conversation_id)
+
+    @timed('memory.log_processing')
+    async def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
+        """Log processing steps for traceability"""
+        pipe = self.log_redis.pipeline(transaction=False)
+        self._queue_log_append(pipe, conversation_id, self._log_entry(agent, action, details))
+        entry_number = (await pipe.execute())[0]
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        await self._trace_memory_state("Log Processing", conversation_id)
+
+    @timed('memory.record_step')
+    async def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                          context_updates: Optional[Dict[str, Any]] = None) -> None:
+        """Append a log entry and apply context updates in one round trip"""
+        pipe = self.log_redis.pipeline(transaction=False)
+        hset_index = self._queue_log_append(pipe, conversation_id, self._log_entry(agent, action, details))
+        if context_updates:
+            pipe.hset(self._context_key(conversation_id), mapping=self._encode_fields(context_updates))
+            self._queue_expire(pipe, self._context_key(conversation_id))
+        results = await pipe.execute(raise_on_error=False)
+        if isinstance(results[0], Exception):
+            raise results[0]
+        entry_number = results[0]
+        if context_updates and isinstance(results[hset_index], Exception):
+            if 'WRONGTYPE' not in str(results[hset_index]):
+                raise results[hset_index]
+            key = self._context_key(conversation_id)
+            await self._migrate_legacy_context(key)
+            await self._hset(key, self._encode_fields(context_updates))
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        if context_updates:
+            trace_event(logger, 'context.update', conversation_id=conversation_id, fields=list(context_updates))
+        await self._trace_memory_state("Record Step", conversation_id)
+
+    @timed('memory.get_processing_history')
+    async def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Retrieve processing history for a conversation, decoded from either log encoding"""
+        history = await self.log_redis.lrange(self._logs_key(conversation_id), 0, -1)
+        return [self._decode_entry(entry) for entry in history]
+
+    @timed('memory.clear_context')
+    async def clear_context(self, conversation_id: str) -> None:
+        """Clear all data for a conversation"""
+        await self.redis.delete(self._context_key(conversation_id), self._logs_key(conversation_id))
+        trace_event(logger, 'memory.clear', conversation_id=conversation_id)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+        await self.log_redis.connection_pool.disconnect()
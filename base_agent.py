@@ -1,15 +1,127 @@
+import asyncio
+import contextvars
+import functools
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
-from shared_memory import SharedMemory
+from concurrent.futures import Executor
+from typing import Dict, Any, List, NamedTuple, Optional
+from metrics import collect_spans, count_document, metrics_enabled, timings_ms
+from parsed_document import ParsedDocument
+from shared_memory import MemoryBackend, get_shared_memory
+
+
+class AgentOutcome(NamedTuple):
+    """Result of an agent's analysis plus what it records in shared memory"""
+    result: Dict[str, Any]
+    action: str
+    details: Dict[str, Any]
+    context_updates: Optional[Dict[str, Any]] = None
+
 
 class BaseAgent(ABC):
-    def __init__(self):
-        self.memory = SharedMemory()
+    def __init__(self, memory: Optional[MemoryBackend] = None, async_memory=None,
+                 executor: Optional[Executor] = None, result_cache=None):
+        # Agents share one memory backend per process (Redis unless MEMORY_URL says otherwise)
+        # unless one is injected
+        self.memory = memory if memory is not None else get_shared_memory()
+        # The async memory may be bound to an event loop, so unless one is injected it is
+        # resolved on each use: the backend's async_view() already memoizes it per loop
+        self._async_memory = async_memory
+        # Executor for CPU-bound work in aprocess(); None uses the loop's default pool
+        self.executor = executor
+        # Optional ResultCache: documents seen before replay their stored outcome
+        self.result_cache = result_cache
 
     @abstractmethod
+    def analyze(self, data: Any) -> AgentOutcome:
+        """Analyze the input data without touching shared memory"""
+        pass
+
     def process(self, data: Any, conversation_id: str) -> Dict[str, Any]:
         """Process the input data"""
-        pass
+        outcome = self.analyze_timed(data)
+        self.record_outcome(conversation_id, outcome)
+        return outcome.result
+
+    async def aprocess(self, data: Any, conversation_id: str) -> Dict[str, Any]:
+        """Process the input data without blocking the event loop"""
+        outcome = await self.run_in_executor(self.analyze_timed, data)
+        await self.arecord_outcome(conversation_id, outcome)
+        return outcome.result
+
+    def cache_namespace(self) -> str:
+        """Results are cached per agent class; include any setting that changes the output"""
+        return self.__class__.__name__
+
+    def analyze_cached(self, data: Any) -> AgentOutcome:
+        """
+        analyze() through the result cache, if one is configured.
+        A hit replays the stored outcome, so the log entry and context updates are still written.
+        """
+        if self.result_cache is None:
+            return self.analyze(data)
+        document = ParsedDocument.of(data)
+        namespace = self.cache_namespace()
+        cached = self.result_cache.get(namespace, document.digest)
+        if cached is not None:
+            result, action, details, context_updates = cached
+            return AgentOutcome(result, action, {**details, 'cache_hit': True}, context_updates)
+
+        start = time.perf_counter()
+        outcome = self.analyze(document)
+        if outcome.result.get('status') != 'error':
+            self.result_cache.put(namespace, document.digest, list(outcome), time.perf_counter() - start)
+        return outcome
+
+    def analyze_timed(self, data: Any) -> AgentOutcome:
+        """
+        analyze_cached() with per-stage timings attached to the logged details.
+        Runs inside the executor in aprocess(), so spans are collected in the thread doing the work.
+        """
+        with collect_spans() as spans:
+            outcome = self.analyze_cached(data)
+        return self.with_timings(outcome, spans)
+
+    def with_timings(self, outcome: AgentOutcome, spans: Optional[Dict[str, float]]) -> AgentOutcome:
+        """Count the document and add its stage timings to the logged details (no-op when metrics are off)"""
+        if spans is None:
+            return outcome
+        count_document(self.__class__.__name__, outcome.result.get('status') == 'error')
+        return outcome._replace(details={**outcome.details, 'timings_ms': timings_ms(spans)})
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        """Run CPU-bound work on the agent's executor"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if metrics_enabled():
+            # Carry the caller's span collector into the worker thread
+            call = functools.partial(contextvars.copy_context().run, call)
+        return await loop.run_in_executor(self.executor, call)
+
+    @property
+    def async_memory(self):
+        if self._async_memory is not None:
+            return self._async_memory
+        return self.memory.async_view()
+
+    def record_outcome(self, conversation_id: str, outcome: AgentOutcome) -> None:
+        """Log the outcome and apply its context updates in one round trip"""
+        self.memory.record_step(
+            conversation_id=conversation_id,
+            agent=self.__class__.__name__,
+            action=outcome.action,
+            details=outcome.details,
+            context_updates=outcome.context_updates
+        )
+
+    async def arecord_outcome(self, conversation_id: str, outcome: AgentOutcome) -> None:
+        await self.async_memory.record_step(
+            conversation_id=conversation_id,
+            agent=self.__class__.__name__,
+            action=outcome.action,
+            details=outcome.details,
+            context_updates=outcome.context_updates
+        )
 
     def log_action(self, conversation_id: str, action: str, details: Dict[str, Any]) -> None:
         """Log an action performed by the agent"""
@@ -24,10 +136,26 @@ class BaseAgent(ABC):
         """Get context for the current conversation"""
         return self.memory.get_context(conversation_id)
 
+    def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        """Get selected context fields without reading the whole context"""
+        return self.memory.get_context_fields(conversation_id, fields)
+
     def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
         """Update context with new information"""
         self.memory.update_context(conversation_id, updates)
 
     def get_history(self, conversation_id: str) -> list:
         """Get processing history for the conversation"""
-        return self.memory.get_processing_history(conversation_id) 
\ No newline at end of file
+        return self.memory.get_processing_history(conversation_id)
+
+    async def alog_action(self, conversation_id: str, action: str, details: Dict[str, Any]) -> None:
+        await self.async_memory.log_processing(conversation_id, self.__class__.__name__, action, details)
+
+    async def aget_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return await self.async_memory.get_context(conversation_id)
+
+    async def aupdate_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        await self.async_memory.update_context(conversation_id, updates)
+
+    async def aget_history(self, conversation_id: str) -> list:
+        return await self.async_memory.get_processing_history(conversation_id)
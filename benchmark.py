@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from email.message import EmailMessage
+from typing import Any, Callable, Dict, List, Optional
+
+from inference_backends import BACKENDS, DEFAULT_BACKEND
+from model_registry import DEFAULT_MODEL_NAME, registry
+from tracing import configure_logging
+
+DEFAULT_RESULTS_DIR = 'benchmark_results'
+
+# p50 slowdowns beyond this fraction are flagged when comparing runs
+REGRESSION_THRESHOLD = 0.10
+
+_WORDS = (
+    'the shipment order account please review attached schedule meeting request update team '
+    'project delivery payment status contract support issue system customer service report '
+    'quarter budget approval pricing supplier warehouse inventory deadline follow regarding'
+).split()
+_INTENT_WORDS = ['invoice', 'RFQ', 'complaint', 'regulation', 'urgent', 'asap', 'fyi']
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _text(rng: random.Random, size: int) -> str:
+    parts, length = [], 0
+    while length < size:
+        sentence = _sentence(rng, rng.randint(6, 16))
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(parts)
+
+
+def make_email(rng: random.Random, body_bytes: int, attachments: int, attachment_bytes: int) -> bytes:
+    msg = EmailMessage()
+    sender = f"user{rng.randint(1, 999)}"
+    msg['From'] = f'"{sender.title()}" <{sender}@example.com>'
+    msg['To'] = 'support@company.com'
+    msg['Subject'] = f"{rng.choice(_INTENT_WORDS)}: {_sentence(rng, 4)}" if rng.random() < 0.5 else _sentence(rng, 5)
+    msg['Date'] = 'Thu, 6 Jan 2024 09:15:23 -0500'
+    msg['Message-ID'] = f"<{uuid.UUID(int=rng.getrandbits(128))}@example.com>"
+    body = _text(rng, body_bytes)
+    # Typical reply shape: new text, signature, quoted thread
+    quoted = '\n'.join('> ' + line for line in _text(rng, body_bytes // 2).split('. '))
+    msg.set_content(f"{body}\n\nBest regards,\n{sender}\n\nOn Mon, Jan 1, 2024 someone wrote:\n{quoted}\n")
+    for n in range(attachments):
+        msg.add_attachment(rng.randbytes(attachment_bytes), maintype='application', subtype='octet-stream',
+                           filename=f'attachment{n}.bin')
+    return msg.as_bytes()
+
+
+def _json_value(rng: random.Random, depth: int, width: int) -> Any:
+    if depth <= 0:
+        return rng.choice([rng.randint(0, 10 ** 6), round(rng.random() * 1000, 2), rng.choice(_WORDS), True, None])
+    if rng.random() < 0.3:
+        # Arrays of same-shaped records, the common shape of exports
+        keys = [f"{rng.choice(_WORDS)}_{i}" for i in range(width)]
+        return [{key: _json_value(rng, 0, width) for key in keys} for _ in range(width)]
+    return {f"{rng.choice(_WORDS)}_{i}": _json_value(rng, depth - 1, width) for i in range(width)}
+
+
+def make_json(rng: random.Random, depth: int, width: int) -> bytes:
+    document = _json_value(rng, depth, width)
+    if not isinstance(document, dict):
+        document = {'records': document}
+    if rng.random() < 0.5:
+        document['invoice_number'] = f"INV-{rng.randint(1, 99999):05d}"
+        document['line_items'] = [{'description': rng.choice(_WORDS), 'amount': rng.randint(1, 500)}]
+    return json.dumps(document).encode()
+
+
+def generate_corpus(count: int, seed: int = 0, email_share: float = 0.5, email_bytes: int = 4096,
+                    attachments: int = 0, attachment_bytes: int = 256 * 1024, json_depth: int = 3,
+                    json_width: int = 5, duplicate_ratio: float = 0.0) -> List[bytes]:
+    """
+    Build a deterministic mixed corpus of emails and JSON documents.
+    A duplicate_ratio share of documents repeat an earlier one; repeated emails
+    get a fresh Received header, as a re-delivered copy would.
+    """
+    rng = random.Random(seed)
+    corpus: List[bytes] = []
+    for _ in range(count):
+        if corpus and rng.random() < duplicate_ratio:
+            original = rng.choice(corpus)
+            if not original.startswith(b'{'):
+                original = f"Received: from mx{rng.randint(1, 99)}.example.net\n".encode() + original
+            corpus.append(original)
+        elif rng.random() < email_share:
+            corpus.append(make_email(rng, email_bytes, attachments, attachment_bytes))
+        else:
+            corpus.append(make_json(rng, json_depth, json_width))
+    return corpus
+
+
+def register_tiny_model(model_name: str = DEFAULT_MODEL_NAME, dim: int = 32, layers: int = 2, seed: int = 0) -> None:
+    """
+    Register a randomly initialized DistilBERT (same architecture, tiny dimensions)
+    under model_name, with a character-level vocabulary so sequence lengths stay realistic
+    """
+    import torch
+    from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+
+    torch.manual_seed(seed)
+    chars = [chr(c) for c in range(33, 127)]
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + chars + ['##' + c for c in chars]
+    vocab_path = os.path.join(tempfile.mkdtemp(prefix='tiny-model-'), 'vocab.txt')
+    with open(vocab_path, 'w') as f:
+        f.write('\n'.join(vocab))
+    tokenizer = DistilBertTokenizerFast(vocab_file=vocab_path)
+    config = DistilBertConfig(vocab_size=len(vocab), dim=dim, hidden_dim=4 * dim, n_layers=layers,
+                              n_heads=max(1, dim // 16), num_labels=2)
+    registry.register(model_name, tokenizer, DistilBertForSequenceClassification(config))
+
+
+def offline_memory():
+    """SharedMemory on an in-process fakeredis server (pip install fakeredis)"""
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise SystemExit("Offline mode needs fakeredis (pip install fakeredis), or pass --redis-url") from e
+    from shared_memory import SharedMemory
+
+    return SharedMemory(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+class StageTimer:
+    """Collects per-call latencies by stage name"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def time(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            total = sum(samples)
+            report[stage] = {
+                'count': len(samples),
+                'p50_ms': round(statistics.median(ordered) * 1000, 4),
+                'p99_ms': round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000, 4),
+                'mean_ms': round(total / len(samples) * 1000, 4),
+                'docs_per_second': round(len(samples) / total, 1) if total > 0 else 0.0
+            }
+        return report
+
+
+def _parse(raw: bytes):
+    from parsed_document import ParsedDocument
+
+    document = ParsedDocument(raw)
+    if document.format == 'json':
+        document.json
+    elif document.format == 'email':
+        document.email_body
+    return document
+
+
+def run_benchmark(corpus: List[bytes], memory, use_llm: bool = True, rules: bool = True,
+                  backend: str = DEFAULT_BACKEND, cache: bool = False) -> Dict[str, Any]:
+    """
+    Time each stage in isolation (parse, classify, each agent's analyze, SharedMemory
+    operations), then the end-to-end pipeline with logging to memory
+    """
+    from email_agent import EmailAgent
+    from json_agent import JSONAgent
+    from llm_classifier_agent import LLMClassifierAgent
+    from result_cache import ResultCache
+
+    classifier = LLMClassifierAgent(memory=memory, backend=backend, rules=rules)
+    agents = {'json_agent': JSONAgent(memory), 'email_agent': EmailAgent(memory)}
+    if use_llm:
+        classifier.preload()
+
+    timer = StageTimer()
+    decided_by: Counter = Counter()
+    for raw in corpus:
+        document = timer.time('parse', _parse, raw)
+        classification = timer.time('classify', classifier.analyze, document, use_llm).result
+        decided_by[classification['decided_by']] += 1
+        route = classification['route_to']
+        outcome = timer.time(route, agents[route].analyze, document)
+
+        conversation_id = str(uuid.uuid4())
+        timer.time('memory.record_step', memory.record_step, conversation_id, route, outcome.action,
+                   outcome.details, outcome.context_updates)
+        timer.time('memory.get_context', memory.get_context, conversation_id)
+        timer.time('memory.get_context_fields', memory.get_context_fields, conversation_id, ['processing_status'])
+        timer.time('memory.get_history', memory.get_processing_history, conversation_id)
+
+    # The pipeline run gets its own agents so the result cache starts cold.
+    # The cache lives in Redis, so a non-Redis memory backend gets an offline one.
+    cache_client = memory.redis if hasattr(memory, 'redis') else offline_memory().redis
+    result_cache = ResultCache(client=cache_client) if cache else None
+    if result_cache is not None:
+        pipeline_classifier = LLMClassifierAgent(memory=memory, backend=backend, rules=rules,
+                                                 result_cache=result_cache)
+        pipeline_agents = {
+            'json_agent': JSONAgent(memory, result_cache=result_cache),
+            'email_agent': EmailAgent(memory, result_cache=result_cache)
+        }
+    else:
+        pipeline_classifier, pipeline_agents = classifier, agents
+
+    def pipeline(raw: bytes) -> None:
+        from parsed_document import ParsedDocument
+
+        document = ParsedDocument(raw)
+        conversation_id = str(uuid.uuid4())
+        classification = pipeline_classifier.process(document, conversation_id, use_llm=use_llm)
+        pipeline_agents[classification['route_to']].process(document, conversation_id)
+
+    for raw in corpus:
+        timer.time('pipeline', pipeline, raw)
+
+    return {
+        'stages': timer.report(),
+        'decided_by': dict(decided_by),
+        'result_cache': result_cache.stats() if result_cache else None
+    }
+
+
+def compare_memory_backends(memories: Dict[str, Any], conversations: int = 200,
+                            steps: int = 4) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Per-operation latency of each memory backend on the same conversation workload"""
+    details = {'status': 'success', 'anomalies_found': 0, 'schema_fingerprint': '0' * 16}
+    report = {}
+    for name, memory in memories.items():
+        timer = StageTimer()
+        for i in range(conversations):
+            conversation_id = f"benchmark-{name}-{i}"
+            for step in range(steps):
+                timer.time('record_step', memory.record_step, conversation_id, 'BenchmarkAgent', 'step',
+                           {**details, 'step': step}, {'processing_status': 'success', 'step': step})
+            timer.time('update_context', memory.update_context, conversation_id, {'reviewed': True})
+            timer.time('get_context_fields', memory.get_context_fields, conversation_id, ['processing_status'])
+            timer.time('get_context', memory.get_context, conversation_id)
+            timer.time('get_history', memory.get_processing_history, conversation_id)
+        memory.close()
+        report[name] = timer.report()
+    return report
+
+
+def _git_commit() -> str:
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=repo).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=repo).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(results: Dict[str, Any], results_dir: str = DEFAULT_RESULTS_DIR) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{results['meta']['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """Per-stage p50 change against a baseline run; slowdowns beyond threshold are flagged"""
+    rows = []
+    for stage, stats in current['stages'].items():
+        before = baseline['stages'].get(stage)
+        if not before or not before['p50_ms']:
+            continue
+        change = (stats['p50_ms'] - before['p50_ms']) / before['p50_ms']
+        rows.append({
+            'stage': stage,
+            'baseline_p50_ms': before['p50_ms'],
+            'p50_ms': stats['p50_ms'],
+            'change': round(change, 4),
+            'regression': change > threshold
+        })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark parsing, classification, agents and shared memory')
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--email-share', type=float, default=0.5, help='Fraction of emails (the rest is JSON)')
+    parser.add_argument('--email-bytes', type=int, default=4096, help='Approximate email body size')
+    parser.add_argument('--attachments', type=int, default=0, help='Attachments per email')
+    parser.add_argument('--attachment-bytes', type=int, default=256 * 1024)
+    parser.add_argument('--json-depth', type=int, default=3)
+    parser.add_argument('--json-width', type=int, default=5)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0)
+    parser.add_argument('--real-model', action='store_true',
+                        help='Use the real classifier model instead of a tiny random one (needs the weights)')
+    parser.add_argument('--redis-url', help='Benchmark against a real Redis instead of in-process fakeredis')
+    parser.add_argument('--memory-url', help='Run the pipeline on another memory backend (memory://, sqlite:///...)')
+    parser.add_argument('--memory-backends', action='store_true',
+                        help='Only compare per-operation latency of the Redis, in-process and SQLite memory backends')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--no-llm', action='store_true')
+    parser.add_argument('--no-rules', action='store_true')
+    parser.add_argument('--cache', action='store_true', help='Enable the result cache in the pipeline run')
+    parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.memory_backends:
+        from local_memory import InProcessMemory, SQLiteMemory
+        from shared_memory import SharedMemory
+
+        with tempfile.TemporaryDirectory() as tmp:
+            memories = {
+                'redis': SharedMemory(args.redis_url) if args.redis_url else offline_memory(),
+                'in_process': InProcessMemory(),
+                'sqlite': SQLiteMemory(os.path.join(tmp, 'memory.db'))
+            }
+            report = compare_memory_backends(memories, conversations=args.documents)
+        # fakeredis has no network round trip, so it understates a real server
+        print(json.dumps({'memory_backends': report, 'redis': 'real' if args.redis_url else 'fakeredis'}, indent=2))
+        return 0
+
+    if not args.real_model:
+        register_tiny_model(seed=args.seed)
+    if args.memory_url:
+        from shared_memory import open_memory
+        memory = open_memory(args.memory_url)
+    elif args.redis_url:
+        from shared_memory import SharedMemory
+        memory = SharedMemory(args.redis_url)
+    else:
+        memory = offline_memory()
+
+    corpus_config = {
+        'documents': args.documents, 'seed': args.seed, 'email_share': args.email_share,
+        'email_bytes': args.email_bytes, 'attachments': args.attachments, 'attachment_bytes': args.attachment_bytes,
+        'json_depth': args.json_depth, 'json_width': args.json_width, 'duplicate_ratio': args.duplicate_ratio
+    }
+    corpus = generate_corpus(args.documents, args.seed, args.email_share, args.email_bytes, args.attachments,
+                             args.attachment_bytes, args.json_depth, args.json_width, args.duplicate_ratio)
+    results = run_benchmark(corpus, memory, use_llm=not args.no_llm, rules=not args.no_rules,
+                            backend=args.backend, cache=args.cache)
+    results['meta'] = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'model': 'real' if args.real_model else 'tiny-random',
+        'redis': 'real' if args.redis_url else 'fakeredis',
+        'memory': args.memory_url.partition('://')[0] if args.memory_url else 'redis',
+        'backend': args.backend,
+        'corpus': corpus_config,
+        'corpus_bytes': sum(len(raw) for raw in corpus)
+    }
+
+    print(json.dumps(results, indent=2))
+    print(f"Saved to {save_results(results, args.results_dir)}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('corpus') != corpus_config or baseline['meta'].get('model') != results['meta']['model']:
+            print('Warning: baseline was run with a different corpus or model', file=sys.stderr)
+        rows = compare_results(baseline, results, args.threshold)
+        print(json.dumps({'comparison': rows}, indent=2))
+        if any(row['regression'] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
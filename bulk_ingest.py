@@ -0,0 +1,363 @@
+import argparse
+import itertools
+import json
+import mailbox
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from inference_backends import BACKENDS, DEFAULT_BACKEND
+from tracing import configure_logging
+
+# (sequence number, document id, raw bytes)
+Document = Tuple[int, str, bytes]
+
+# Stable namespace so a resumed run reuses the same conversation ids
+CONVERSATION_NAMESPACE = uuid.UUID('5f0c6a52-1d7e-4c36-9a8e-3b2f4d1e7c90')
+
+
+# Readers yield (document id, raw bytes) from the `skip`-th document on; skipped
+# documents are only counted, their payload is never read
+
+
+def iter_mbox(path: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    box = mailbox.mbox(path, create=False)
+    try:
+        for key in itertools.islice(box.iterkeys(), skip, None):
+            yield f"{os.path.basename(path)}#{key}", box.get_bytes(key)
+    finally:
+        box.close()
+
+
+def iter_maildir(path: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    box = mailbox.Maildir(path, factory=None, create=False)
+    for key in sorted(box.iterkeys())[skip:]:
+        yield key, box.get_bytes(key)
+
+
+def iter_directory(path: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    seq = 0
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            seq += 1
+            if seq <= skip:
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, 'rb') as f:
+                yield os.path.relpath(file_path, path), f.read()
+
+
+def iter_jsonl(path: str, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    seq = 0
+    with open(path, 'rb') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.isspace():
+                continue
+            seq += 1
+            if seq > skip:
+                yield f"{os.path.basename(path)}:{line_number}", line.strip()
+
+
+READERS = {
+    'mbox': iter_mbox,
+    'maildir': iter_maildir,
+    'directory': iter_directory,
+    'jsonl': iter_jsonl
+}
+
+
+def detect_input_format(path: str) -> str:
+    if os.path.isdir(path):
+        if all(os.path.isdir(os.path.join(path, sub)) for sub in ('cur', 'new', 'tmp')):
+            return 'maildir'
+        return 'directory'
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    with open(path, 'rb') as f:
+        if f.read(5) == b'From ':
+            return 'mbox'
+    raise ValueError(f"Cannot detect input format of {path}; pass --input-format")
+
+
+def iter_documents(path: str, input_format: str, skip: int = 0) -> Iterator[Document]:
+    """Number documents lazily, skipping the first `skip` already checkpointed ones"""
+    for seq, (doc_id, raw) in enumerate(READERS[input_format](path, skip), skip):
+        yield seq, doc_id, raw
+
+
+def iter_chunks(documents: Iterator[Document], chunk_size: int) -> Iterator[List[Document]]:
+    chunk: List[Document] = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Checkpoint:
+    """
+    Tracks the highest sequence number below which every document is done.
+    Chunks may finish out of order; the watermark only advances over a
+    contiguous prefix, so a resumed run never skips unfinished work.
+    """
+
+    def __init__(self, path: Optional[str], input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.watermark = 0
+        self._done: Set[int] = set()
+        # True when an earlier run of the same input was checkpointed
+        self.resumed = False
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('input') == self.input_path:
+                self.watermark = state['watermark']
+                self.resumed = True
+
+    def complete(self, seqs: List[int]) -> None:
+        self._done.update(seqs)
+        advanced = False
+        while self.watermark in self._done:
+            self._done.remove(self.watermark)
+            self.watermark += 1
+            advanced = True
+        if advanced:
+            self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'input': self.input_path, 'watermark': self.watermark}, f)
+        os.replace(tmp_path, self.path)
+
+
+def completed_in_output(output_path: str, watermark: int) -> Set[int]:
+    """
+    Sequence numbers past the watermark whose summaries an interrupted run already wrote.
+    A partially written last line is cut off so appends start on a fresh line.
+    """
+    done: Set[int] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb+') as f:
+        valid = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            valid += len(line)
+            try:
+                seq = json.loads(line)['seq']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if seq >= watermark:
+                done.add(seq)
+        f.truncate(valid)
+    return done
+
+
+# Result cache counters summed across workers for the report
+CACHE_COUNTERS = ('local_hits', 'redis_hits', 'misses', 'time_saved')
+
+# Per-process agents, created once by the pool initializer
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(use_llm: bool, torch_threads: int, schema_samples: List[str], cache_ttl: Optional[int],
+                 backend: str, rules: Optional[str]) -> None:
+    from email_agent import EmailAgent
+    from json_agent import JSONAgent
+    from llm_classifier_agent import LLMClassifierAgent
+    from parsed_document import ParsedDocument
+    from pdf_agent import PDFAgent
+    from result_cache import ResultCache
+    from rule_cascade import RuleCascade
+
+    if use_llm and torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+    for sample in schema_samples:
+        JSONAgent.register_sample(sample)
+    _worker['parse'] = ParsedDocument
+    _worker['use_llm'] = use_llm
+    # Duplicates across workers are found through Redis; the local LRU catches repeats within one
+    cache = _worker['cache'] = ResultCache(ttl=cache_ttl) if cache_ttl else None
+    # rules: a config path, '' for the built-in rules, or None to disable the cascade
+    _worker['classifier'] = LLMClassifierAgent(
+        result_cache=cache, backend=backend, num_threads=torch_threads or None,
+        rules=rules is not None, cascade=RuleCascade.from_file(rules) if rules else None
+    )
+    _worker['agents'] = {
+        'json_agent': JSONAgent(result_cache=cache),
+        'email_agent': EmailAgent(result_cache=cache),
+        # Documents are already spread over the pool; a nested page pool would only oversubscribe
+        'pdf_agent': PDFAgent(result_cache=cache, workers=1)
+    }
+    _worker['memory'] = _worker['classifier'].memory
+
+
+def _process_chunk(chunk: List[Document]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Classify a chunk with one batched forward pass, then route each document.
+    Returns: per-document summaries and the chunk's result cache counters
+    """
+    classifier = _worker['classifier']
+    cache = _worker['cache']
+    before = cache.stats() if cache else {}
+    datas = [_worker['parse'](raw) for _, _, raw in chunk]
+    conversation_ids = [str(uuid.uuid5(CONVERSATION_NAMESPACE, doc_id)) for _, doc_id, _ in chunk]
+    if _worker['use_llm']:
+        classifications = classifier.classify_batch(datas, conversation_ids)
+    else:
+        classifications = [classifier.process(data, cid, use_llm=False) for data, cid in zip(datas, conversation_ids)]
+
+    summaries = []
+    for (seq, doc_id, _), data, conversation_id, classification in zip(chunk, datas, conversation_ids, classifications):
+        agent = _worker['agents'].get(classification['route_to'], _worker['agents']['email_agent'])
+        try:
+            status = agent.process(data, conversation_id).get('status', 'success')
+        except Exception as e:
+            status = f'error: {e}'
+        summaries.append({
+            'seq': seq,
+            'doc_id': doc_id,
+            'conversation_id': conversation_id,
+            'format': classification['format'],
+            'intent': classification['intent'],
+            'route_to': classification['route_to'],
+            'decided_by': classification['decided_by'],
+            'status': status
+        })
+    # Buffered memory writes (SQLite) are committed before the chunk counts as done for the checkpoint
+    _worker['memory'].flush()
+    after = cache.stats() if cache else {}
+    return summaries, {key: after[key] - before[key] for key in CACHE_COUNTERS if key in after}
+
+
+def run_bulk(path: str, input_format: Optional[str] = None, workers: int = 2, chunk_size: int = 16,
+             checkpoint_path: Optional[str] = None, output_path: Optional[str] = None,
+             use_llm: bool = True, schema_samples: Optional[List[str]] = None,
+             cache_ttl: Optional[int] = None, backend: str = DEFAULT_BACKEND,
+             rules: Optional[str] = '') -> Dict[str, Any]:
+    """
+    Stream documents from `path` through classify -> route -> agent on a process pool.
+    At most 2 * workers chunks are in flight, so memory stays bounded regardless of input size.
+    Returns: throughput report
+    """
+    input_format = input_format or detect_input_format(path)
+    checkpoint = Checkpoint(checkpoint_path, path)
+    # Chunks that finished past the watermark are in the output already: skip them instead of
+    # writing their summaries twice (without an output file they are simply processed again)
+    done = completed_in_output(output_path, checkpoint.watermark) if output_path and checkpoint.resumed else set()
+    checkpoint.complete(sorted(done))
+    resumed_from = checkpoint.watermark
+    documents = (document for document in iter_documents(path, input_format, skip=resumed_from)
+                 if document[0] not in done)
+    chunks = iter_chunks(documents, chunk_size)
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    counts: Counter = Counter()
+    cache_totals: Counter = Counter()
+    decided_by: Counter = Counter()
+    processed = 0
+    output = open(output_path, 'a') if output_path else None
+    start = time.perf_counter()
+    try:
+        initargs = (use_llm, torch_threads, schema_samples or [], cache_ttl, backend, rules)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            pending: Set[Future] = set()
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < 2 * workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        pending.add(pool.submit(_process_chunk, chunk))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    summaries, cache_delta = future.result()
+                    cache_totals.update(cache_delta)
+                    for summary in summaries:
+                        counts[summary['route_to']] += 1
+                        decided_by[summary['decided_by']] += 1
+                        if summary['status'] not in ('success', 'warning'):
+                            counts['errors'] += 1
+                        if output:
+                            output.write(json.dumps(summary) + '\n')
+                    if output:
+                        output.flush()
+                    processed += len(summaries)
+                    checkpoint.complete([summary['seq'] for summary in summaries])
+    finally:
+        if output:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'input': path,
+        'input_format': input_format,
+        'resumed_from': resumed_from,
+        'processed': processed,
+        'by_route': {route: n for route, n in counts.items() if route != 'errors'},
+        'errors': counts['errors'],
+        'decided_by': dict(decided_by),
+        'skipped_inference_share': round(
+            sum(n for stage, n in decided_by.items() if stage != 'model') / processed, 4
+        ) if processed else 0.0,
+        'elapsed_seconds': round(elapsed, 3),
+        'docs_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0.0
+    }
+    if cache_ttl:
+        hits = cache_totals['local_hits'] + cache_totals['redis_hits']
+        lookups = hits + cache_totals['misses']
+        report['result_cache'] = {
+            'hits': hits,
+            'misses': cache_totals['misses'],
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'time_saved': round(cache_totals['time_saved'], 3)
+        }
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Bulk-ingest mbox, maildir, directory or JSON-Lines inputs')
+    parser.add_argument('path')
+    parser.add_argument('--input-format', choices=sorted(READERS), help='Detected from the path if omitted')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=16, help='Documents per batched classification')
+    parser.add_argument('--checkpoint', help='Checkpoint file; an interrupted run resumes from it')
+    parser.add_argument('--output', help='Append per-document summaries as JSON-Lines')
+    parser.add_argument('--no-llm', action='store_true', help='Route by format only')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help='Classifier inference backend')
+    parser.add_argument('--rules', default='', help='JSON rules config for the fast-path cascade (default: built-in rules)')
+    parser.add_argument('--no-rules', action='store_true', help='Send every document to the model')
+    parser.add_argument('--cache', action='store_true', help='Reuse results for duplicate documents (via Redis)')
+    parser.add_argument('--cache-ttl', type=int, default=24 * 3600, help='Seconds a cached result is kept')
+    parser.add_argument('--schema-sample', action='append', default=[],
+                        help='JSON file whose schema gets a pre-compiled validator (repeatable)')
+    args = parser.parse_args()
+
+    configure_logging()
+    report = run_bulk(args.path, args.input_format, args.workers, args.chunk_size,
+                      args.checkpoint, args.output, use_llm=not args.no_llm,
+                      schema_samples=args.schema_sample, cache_ttl=args.cache_ttl if args.cache else None,
+                      backend=args.backend, rules=None if args.no_rules else args.rules)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
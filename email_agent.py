@@ -1,7 +1,12 @@
-import email
+from concurrent.futures import Executor
 from email.message import EmailMessage
-from typing import Dict, Any, Optional
-from base_agent import BaseAgent
+from typing import Dict, Any, List, Optional
+from base_agent import AgentOutcome, BaseAgent
+from keyword_matcher import KeywordMatch, KeywordTiers, get_keyword_matcher
+from metrics import span
+from mime_reader import extract_body
+from parsed_document import DocumentInput, ParsedDocument
+from shared_memory import MemoryBackend
 from email_validator import validate_email, EmailNotValidError
 import re
 
@@ -12,14 +17,27 @@ class EmailAgent(BaseAgent):
         'low': ['fyi', 'update', 'newsletter', 'information']
     }
 
-    def process(self, data: str, conversation_id: str) -> Dict[str, Any]:
+    # Only this many leading body characters are scanned for urgency keywords
+    URGENCY_SCAN_CHARS = 4096
+
+    def __init__(self, memory: Optional[MemoryBackend] = None, async_memory=None, executor: Optional[Executor] = None,
+                 urgency_keywords: Optional[KeywordTiers] = None, urgency_scan_chars: Optional[int] = None,
+                 result_cache=None):
+        super().__init__(memory, async_memory, executor, result_cache)
+        # Compiled once per distinct keyword set; agents for tenants sharing a set share the matcher
+        self.urgency_matcher = get_keyword_matcher(urgency_keywords or self.URGENCY_KEYWORDS)
+        self.urgency_scan_chars = urgency_scan_chars if urgency_scan_chars is not None else self.URGENCY_SCAN_CHARS
+
+    def cache_namespace(self) -> str:
+        return f"{self.__class__.__name__}:{self.urgency_matcher.fingerprint}:{self.urgency_scan_chars}"
+
+    def analyze(self, data: DocumentInput) -> AgentOutcome:
         """Process email content and extract relevant information"""
         try:
-            # Parse email
-            if isinstance(data, str):
-                msg = email.message_from_string(data)
-            else:
-                msg = email.message_from_bytes(data)
+            # Parse email (reuses the Message if the classifier already parsed it)
+            document = ParsedDocument.of(data)
+            with span('email.parse'):
+                msg = document.message
 
             # Extract basic metadata
             metadata = self._extract_metadata(msg)
@@ -27,52 +45,54 @@ class EmailAgent(BaseAgent):
             # Extract and validate sender
             sender_info = self._validate_sender(metadata.get('from', ''))
             
-            # Determine urgency
-            content = self._get_email_content(msg)
-            urgency = self._determine_urgency(content, msg['subject'] or '')
+            # Determine urgency on the decoded, capped body without quoted replies or signature
+            with span('email.body'):
+                body = document.email_body
+            content = body.text
+            with span('email.urgency'):
+                urgency_matches = self._find_urgency_keywords(content, msg['subject'] or '')
+            urgency = self._determine_urgency(urgency_matches)
 
             # Format for CRM
             crm_format = self._format_for_crm(metadata, sender_info, content, urgency)
+            crm_format['metadata']['attachments'] = body.attachments
 
             result = {
                 'metadata': metadata,
                 'sender': sender_info,
                 'urgency': urgency,
+                'urgency_matches': {
+                    field: [match._asdict() for match in matches]
+                    for field, matches in urgency_matches.items()
+                },
+                'attachments': body.attachments,
+                'body_truncated': body.truncated,
                 'crm_format': crm_format,
                 'status': 'success'
             }
 
-            # Log the processing
-            self.log_action(
-                conversation_id=conversation_id,
+            return AgentOutcome(
+                result=result,
                 action='process_email',
                 details={
                     'sender': sender_info['email'],
                     'urgency': urgency,
-                    'subject': metadata.get('subject', '')
+                    'subject': metadata.get('subject', ''),
+                    'attachments': len(body.attachments)
+                },
+                context_updates={
+                    'email_sender': sender_info['email'],
+                    'email_urgency': urgency,
+                    'email_subject': metadata.get('subject', '')
                 }
             )
 
-            # Update context
-            self.update_context(conversation_id, {
-                'email_sender': sender_info['email'],
-                'email_urgency': urgency,
-                'email_subject': metadata.get('subject', '')
-            })
-
-            return result
-
         except Exception as e:
             error_result = {
                 'status': 'error',
                 'error': f'Error processing email: {str(e)}'
             }
-            self.log_action(
-                conversation_id=conversation_id,
-                action='process_email_error',
-                details=error_result
-            )
-            return error_result
+            return AgentOutcome(error_result, 'process_email_error', error_result)
 
     def _extract_metadata(self, msg: EmailMessage) -> Dict[str, str]:
         """Extract basic email metadata"""
@@ -113,29 +133,21 @@ class EmailAgent(BaseAgent):
             }
 
     def _get_email_content(self, msg: EmailMessage) -> str:
-        """Extract email content, handling multipart messages"""
-        if msg.is_multipart():
-            parts = []
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    parts.append(part.get_payload(decode=True).decode())
-            return "\n".join(parts)
-        else:
-            return msg.get_payload(decode=True).decode()
-
-    def _determine_urgency(self, content: str, subject: str) -> str:
-        """Determine email urgency based on content and subject"""
-        text = (content + " " + subject).lower()
-        
-        # Check for explicit urgency markers
-        if any(marker in text for marker in self.URGENCY_KEYWORDS['high']):
-            return 'high'
-        elif any(marker in text for marker in self.URGENCY_KEYWORDS['medium']):
-            return 'medium'
-        elif any(marker in text for marker in self.URGENCY_KEYWORDS['low']):
-            return 'low'
-        
-        return 'normal'
+        """Extract the cleaned plain-text content, handling multipart messages and charsets"""
+        return extract_body(msg).text
+
+    def _find_urgency_keywords(self, content: str, subject: str) -> Dict[str, List[KeywordMatch]]:
+        """Find urgency keywords in the subject and the leading part of the body"""
+        return {
+            'subject': self.urgency_matcher.scan(subject),
+            'body': self.urgency_matcher.scan(content, self.urgency_scan_chars)
+        }
+
+    def _determine_urgency(self, matches: Dict[str, List[KeywordMatch]]) -> str:
+        """Determine email urgency from the highest tier matched in content or subject"""
+        return self.urgency_matcher.top_tier(
+            [match for field_matches in matches.values() for match in field_matches], 'normal'
+        )
 
     def _format_for_crm(self, metadata: Dict[str, str], sender: Dict[str, str],
                        content: str, urgency: str) -> Dict[str, Any]:
@@ -0,0 +1,245 @@
+import argparse
+import copy
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from model_registry import DEFAULT_MODEL_NAME, LoadedModel, registry
+
+DEFAULT_BACKEND = 'eager'
+
+# Largest per-class probability difference from eager that still counts as parity
+DEFAULT_TOLERANCE = 0.02
+
+
+class InferenceBackend(ABC):
+    """Turns a padded tokenizer batch into class probabilities for one loaded model"""
+
+    name = ''
+    # Tensor type requested from tokenizer.pad()
+    tensor_type = 'pt'
+
+    def __init__(self, loaded: LoadedModel, num_threads: Optional[int] = None):
+        self.loaded = loaded
+        self.num_threads = num_threads
+
+    @abstractmethod
+    def predict_proba(self, inputs: Any):
+        """Returns: numpy array of shape (batch, num_labels)"""
+        pass
+
+    def warmup(self) -> None:
+        self.predict_proba(self.loaded.tokenizer(['warm up'], return_tensors=self.tensor_type))
+
+
+class EagerBackend(InferenceBackend):
+    """The fp32 model in eager mode under no_grad, as loaded"""
+
+    name = 'eager'
+
+    def predict_proba(self, inputs: Any):
+        import torch
+
+        with torch.no_grad():
+            logits = self.loaded.model(**inputs.to(self.loaded.device)).logits
+            return torch.softmax(logits, dim=-1).cpu().numpy()
+
+
+class InferenceModeBackend(InferenceBackend):
+    """
+    fp32 eager model under torch.inference_mode with tuned intra-op threads.
+    torch threads are process-wide, so the last backend created sets them.
+    """
+
+    name = 'inference_mode'
+
+    def __init__(self, loaded: LoadedModel, num_threads: Optional[int] = None):
+        super().__init__(loaded, num_threads)
+        import torch
+
+        torch.set_num_threads(num_threads or os.cpu_count() or 1)
+
+    def predict_proba(self, inputs: Any):
+        import torch
+
+        with torch.inference_mode():
+            logits = self.loaded.model(**inputs.to(self.loaded.device)).logits
+            return torch.softmax(logits, dim=-1).cpu().numpy()
+
+
+class QuantizedBackend(InferenceModeBackend):
+    """Dynamic int8 quantization of the Linear layers (CPU only)"""
+
+    name = 'int8'
+
+    def __init__(self, loaded: LoadedModel, num_threads: Optional[int] = None):
+        import torch
+
+        model = torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(loaded.model).to('cpu'), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(LoadedModel(loaded.tokenizer, model.eval(), torch.device('cpu')), num_threads)
+
+
+class OnnxBackend(InferenceBackend):
+    """The model exported to ONNX and run by ONNX Runtime (requires onnx and onnxruntime)"""
+
+    name = 'onnx'
+    tensor_type = 'np'
+
+    def __init__(self, loaded: LoadedModel, num_threads: Optional[int] = None, onnx_path: Optional[str] = None):
+        super().__init__(loaded, num_threads)
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The 'onnx' backend needs the onnx and onnxruntime packages") from e
+
+        self.onnx_path = onnx_path or os.path.join(tempfile.mkdtemp(prefix='classifier-onnx-'), 'model.onnx')
+        if not os.path.exists(self.onnx_path):
+            self._export(self.onnx_path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+        self.session = onnxruntime.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _export(self, path: str) -> None:
+        import torch
+
+        model = copy.deepcopy(self.loaded.model).to('cpu').eval()
+        sample = self.loaded.tokenizer(['export sample'], return_tensors='pt')
+        dynamic_axes = {'input_ids': {0: 'batch', 1: 'sequence'}, 'attention_mask': {0: 'batch', 1: 'sequence'},
+                        'logits': {0: 'batch'}}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, (sample['input_ids'], sample['attention_mask']), path,
+                input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+                dynamic_axes=dynamic_axes, opset_version=17, dynamo=False
+            )
+
+    def predict_proba(self, inputs: Any):
+        import numpy as np
+
+        feeds = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        logits = self.session.run(None, feeds)[0]
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+
+BACKENDS = {backend.name: backend for backend in (EagerBackend, InferenceModeBackend, QuantizedBackend, OnnxBackend)}
+
+_backends: Dict[tuple, InferenceBackend] = {}
+_lock = threading.Lock()
+
+
+def get_backend(model_name: str = DEFAULT_MODEL_NAME, backend: str = DEFAULT_BACKEND,
+                num_threads: Optional[int] = None) -> InferenceBackend:
+    """Return the process-wide backend for a model, building (quantizing/exporting) it on first use"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; choose from {sorted(BACKENDS)}")
+    key = (model_name, backend, num_threads)
+    instance = _backends.get(key)
+    if instance is None:
+        with _lock:
+            instance = _backends.get(key)
+            if instance is None:
+                instance = _backends[key] = BACKENDS[backend](registry.get(model_name), num_threads)
+    return instance
+
+
+def _run(backend: InferenceBackend, texts: List[str], batch_size: int):
+    """Probabilities for all texts plus per-batch latencies"""
+    import numpy as np
+
+    tokenizer = backend.loaded.tokenizer
+    probs, latencies = [], []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(texts[start:start + batch_size], truncation=True, max_length=512,
+                           padding='longest', return_tensors=backend.tensor_type)
+        began = time.perf_counter()
+        probs.append(backend.predict_proba(inputs))
+        latencies.append(time.perf_counter() - began)
+    return np.concatenate(probs), latencies
+
+
+def compare_backends(texts: List[str], model_name: str = DEFAULT_MODEL_NAME, backends: Optional[List[str]] = None,
+                     batch_size: int = 8, repeats: int = 3, tolerance: float = DEFAULT_TOLERANCE,
+                     num_threads: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Check each backend's probabilities against the eager model and time it on the same texts.
+    Returns: one report per backend, fastest first
+    """
+    reference, _ = _run(get_backend(model_name, 'eager'), texts, batch_size)
+    reports = []
+    for name in backends or list(BACKENDS):
+        try:
+            backend = get_backend(model_name, name, num_threads)
+        except ImportError as e:
+            reports.append({'backend': name, 'error': str(e)})
+            continue
+        backend.warmup()
+        latencies: List[float] = []
+        for _ in range(repeats):
+            probs, run_latencies = _run(backend, texts, batch_size)
+            latencies.extend(run_latencies)
+        max_diff = float(abs(probs - reference).max())
+        agreement = float((probs.argmax(axis=-1) == reference.argmax(axis=-1)).mean())
+        total = sum(latencies)
+        reports.append({
+            'backend': name,
+            'max_prob_diff': round(max_diff, 6),
+            'label_agreement': round(agreement, 4),
+            'within_tolerance': max_diff <= tolerance,
+            'p50_batch_ms': round(statistics.median(latencies) * 1000, 3),
+            # Nearest rank: with few samples the slowest batch, never one below the median
+            'p95_batch_ms': round(sorted(latencies)[max(0, math.ceil(0.95 * len(latencies)) - 1)] * 1000, 3),
+            'docs_per_second': round(len(texts) * repeats / total, 1) if total > 0 else 0.0
+        })
+    reports.sort(key=lambda report: -report.get('docs_per_second', 0.0))
+    return reports
+
+
+def pick_backend(reports: List[Dict[str, Any]]) -> str:
+    """Fastest backend whose outputs stayed within tolerance of eager"""
+    for report in reports:
+        if report.get('within_tolerance'):
+            return report['backend']
+    return DEFAULT_BACKEND
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare classifier inference backends for parity and speed')
+    parser.add_argument('files', nargs='*', help='Documents to classify (default: samples/)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME)
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS), help='Backends to compare (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, help='Intra-op threads (default: all cores)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    from llm_classifier_agent import LLMClassifierAgent
+    from parsed_document import ParsedDocument
+
+    files = args.files or [os.path.join('samples', name) for name in sorted(os.listdir('samples'))]
+    classifier = LLMClassifierAgent(model_name=args.model)
+    texts = []
+    for file_path in files:
+        document = ParsedDocument.from_file(file_path)
+        texts.append(classifier._build_prompt(classifier._extract_content(document, document.format)))
+
+    reports = compare_backends(texts, args.model, args.backend, args.batch_size, args.repeats,
+                               args.tolerance, args.threads)
+    print(json.dumps({'reports': reports, 'recommended': pick_backend(reports)}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,42 @@
+import hashlib
 import json
-from typing import Dict, Any, List, Optional
-from base_agent import BaseAgent
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Type
+from base_agent import AgentOutcome, BaseAgent
+from metrics import span
+from parsed_document import DocumentInput, ParsedDocument
 from pydantic import BaseModel, ValidationError, create_model
 
 class JSONAgent(BaseAgent):
-    def process(self, data: str, conversation_id: str) -> Dict[str, Any]:
+    # Compiled pydantic validators, shared by all instances and keyed by schema fingerprint
+    VALIDATOR_CACHE_SIZE = 256
+    _validators: "OrderedDict[str, Type[BaseModel]]" = OrderedDict()
+    _registered_validators: Dict[str, Type[BaseModel]] = {}
+    _validator_lock = threading.Lock()
+    _validator_stats = {'hits': 0, 'misses': 0}
+
+    # Occurrences of one anomaly type reported per path pattern before summarizing
+    MAX_ANOMALIES_PER_PATH = 20
+
+    # Deepest container nesting accepted. The traversal itself is iterative, but the
+    # validator build, schema fingerprint and memory writes recurse per level
+    MAX_DEPTH = 100
+
+    def analyze(self, data: DocumentInput) -> AgentOutcome:
         """Process JSON input and extract/validate fields"""
         try:
-            # Parse JSON
-            json_data = json.loads(data)
+            # Parse JSON (reuses the tree if the classifier already decoded it)
+            with span('json.parse'):
+                json_data = ParsedDocument.of(data).json
             
-            # Infer schema from data
-            schema = self._infer_schema(json_data)
+            # Infer schema and check for anomalies in one traversal
+            with span('json.analyze'):
+                schema, anomalies = self._analyze_json(json_data)
             
             # Validate and transform data
-            validated_data = self._validate_data(json_data, schema)
-            
-            # Check for anomalies
-            anomalies = self._check_anomalies(json_data)
+            with span('json.validate'):
+                validated_data = self._validate_data(json_data, schema)
             
             result = {
                 'validated_data': validated_data,
@@ -26,75 +45,318 @@ class JSONAgent(BaseAgent):
                 'status': 'success' if not anomalies else 'warning'
             }
 
-            # Log the processing
-            self.log_action(
-                conversation_id=conversation_id,
+            return AgentOutcome(
+                result=result,
                 action='process_json',
                 details={
-                    'schema': schema,
+                    # The full schema is kept in context; the log only needs to identify it
+                    'schema_fingerprint': self._schema_fingerprint(schema),
                     'anomalies_found': len(anomalies),
                     'status': result['status']
+                },
+                context_updates={
+                    'json_schema': schema,
+                    'anomalies': anomalies,
+                    'processing_status': result['status']
                 }
             )
 
-            # Update context
-            self.update_context(conversation_id, {
-                'json_schema': schema,
-                'anomalies': anomalies,
-                'processing_status': result['status']
-            })
-
-            return result
-
         except json.JSONDecodeError as e:
             error_result = {
                 'status': 'error',
                 'error': f'Invalid JSON format: {str(e)}'
             }
-            self.log_action(
-                conversation_id=conversation_id,
-                action='process_json_error',
-                details=error_result
-            )
-            return error_result
+            return AgentOutcome(error_result, 'process_json_error', error_result)
+        except (ValueError, RecursionError) as e:
+            # Nesting beyond MAX_DEPTH; RecursionError if a lowered interpreter limit is hit first
+            error_result = {
+                'status': 'error',
+                'error': f'Unsupported JSON structure: {str(e) or type(e).__name__}'
+            }
+            return AgentOutcome(error_result, 'process_json_error', error_result)
+
+    @classmethod
+    def register_schema(cls, schema: Dict[str, Any]) -> str:
+        """
+        Compile and pin a validator for a known schema so matching documents skip model creation.
+        Returns: the schema fingerprint
+        """
+        fingerprint = cls._schema_fingerprint(schema)
+        model = cls._create_validator(schema)
+        with cls._validator_lock:
+            cls._registered_validators[fingerprint] = model
+        return fingerprint
+
+    @classmethod
+    def register_sample(cls, file_path: str) -> str:
+        """Register the schema inferred from a sample JSON file (e.g. samples/invoice.json)"""
+        with open(file_path, 'rb') as f:
+            return cls.register_schema(cls._infer_schema(json.load(f)))
 
-    def _infer_schema(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    @classmethod
+    def validator_cache_info(cls) -> Dict[str, int]:
+        with cls._validator_lock:
+            return {
+                'hits': cls._validator_stats['hits'],
+                'misses': cls._validator_stats['misses'],
+                'cached': len(cls._validators),
+                'registered': len(cls._registered_validators),
+                'max_size': cls.VALIDATOR_CACHE_SIZE
+            }
+
+    @classmethod
+    def clear_validator_cache(cls) -> None:
+        with cls._validator_lock:
+            cls._validators.clear()
+            cls._validator_stats.update(hits=0, misses=0)
+
+    @staticmethod
+    def _schema_fingerprint(schema: Dict[str, Any]) -> str:
+        canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    @classmethod
+    def _get_validator(cls, schema: Dict[str, Any]) -> Type[BaseModel]:
+        """Return the compiled validator for a schema, building it only on a cache miss"""
+        fingerprint = cls._schema_fingerprint(schema)
+        with cls._validator_lock:
+            model = cls._registered_validators.get(fingerprint)
+            if model is None:
+                model = cls._validators.get(fingerprint)
+                if model is not None:
+                    cls._validators.move_to_end(fingerprint)
+            if model is not None:
+                cls._validator_stats['hits'] += 1
+                return model
+            cls._validator_stats['misses'] += 1
+
+        model = cls._create_validator(schema)
+        with cls._validator_lock:
+            cls._validators[fingerprint] = model
+            cls._validators.move_to_end(fingerprint)
+            while len(cls._validators) > cls.VALIDATOR_CACHE_SIZE:
+                cls._validators.popitem(last=False)
+        return model
+
+    @classmethod
+    def _infer_schema(cls, data: Any) -> Dict[str, Any]:
         """Infer the schema from the JSON data"""
-        def get_type(value: Any) -> str:
-            if isinstance(value, bool):
-                return 'boolean'
-            elif isinstance(value, int):
-                return 'integer'
-            elif isinstance(value, float):
-                return 'number'
-            elif isinstance(value, str):
-                return 'string'
-            elif isinstance(value, list):
-                return 'array'
-            elif isinstance(value, dict):
-                return 'object'
-            elif value is None:
-                return 'null'
-            return 'unknown'
-
-        def infer_field(value: Any) -> Dict[str, Any]:
-            field_type = get_type(value)
-            schema = {'type': field_type}
-            
+        return cls._analyze_json(data)[0]
+
+    _JSON_TYPES = {
+        bool: 'boolean',
+        int: 'integer',
+        float: 'number',
+        str: 'string',
+        list: 'array',
+        dict: 'object',
+        type(None): 'null'
+    }
+
+    @classmethod
+    def _json_type(cls, value: Any) -> str:
+        json_type = cls._JSON_TYPES.get(type(value))
+        if json_type is not None:
+            return json_type
+        # Subclasses of the builtin types
+        if isinstance(value, bool):
+            return 'boolean'
+        elif isinstance(value, int):
+            return 'integer'
+        elif isinstance(value, float):
+            return 'number'
+        elif isinstance(value, str):
+            return 'string'
+        elif isinstance(value, list):
+            return 'array'
+        elif isinstance(value, dict):
+            return 'object'
+        return 'unknown'
+
+    @classmethod
+    def _analyze_json(cls, data: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Infer the schema and collect anomalies in a single iterative traversal.
+        Array item schemas are merged across every element, and each anomaly type is
+        reported at most MAX_ANOMALIES_PER_PATH times per path pattern (indices as [*]).
+        Raises ValueError if containers nest deeper than MAX_DEPTH.
+        """
+        anomalies: List[Dict[str, Any]] = []
+        seen: Dict[Tuple[str, Optional[tuple]], int] = {}
+        json_type = cls._json_type
+        type_names = cls._JSON_TYPES
+        containers = ('object', 'array')
+        limit = cls.MAX_ANOMALIES_PER_PATH
+        max_depth = cls.MAX_DEPTH
+
+        # Paths are (parent, key) chains, rendered only when an anomaly is reported.
+        # Patterns are chains too, with every array index replaced by '[*]', so all
+        # elements of an array share one pattern object
+        def render(chain: Optional[tuple]) -> str:
+            parts = []
+            while chain is not None:
+                chain, key = chain
+                if isinstance(key, int):
+                    parts.append(f'[{key}]')
+                elif key == '[*]':
+                    parts.append(key)
+                else:
+                    parts.append(f'.{key}' if chain is not None else key)
+            return ''.join(reversed(parts))
+
+        def report(anomaly_type: str, chain: Optional[tuple], pattern: Optional[tuple], **extra: Any) -> None:
+            key = (anomaly_type, pattern)
+            count = seen.get(key, 0) + 1
+            seen[key] = count
+            if count <= limit:
+                anomalies.append({'type': anomaly_type, 'path': render(chain), **extra})
+
+        root: Dict[str, Any] = {}
+        # Work items: (value, schema to fill, path chain, pattern chain, depth), or
+        # (merge marker, array schema, element schemas, None, depth) to merge item schemas
+        # once every element subtree has been built
+        merge = object()
+        stack: List[tuple] = [(data, root, None, None, 1)]
+        while stack:
+            value, schema, chain, pattern, depth = stack.pop()
+            if depth > max_depth:
+                raise ValueError(f'nesting exceeds {max_depth} levels at {render(chain)[:120]}')
+            if value is merge:
+                merged = chain[0]
+                for element_schema in chain[1:]:
+                    cls._merge_schema(merged, element_schema)
+                schema['items'] = merged
+                continue
+
+            field_type = json_type(value)
+            schema['type'] = field_type
+
             if field_type == 'object':
-                schema['properties'] = {
-                    k: infer_field(v) for k, v in value.items()
-                }
-            elif field_type == 'array' and value:
-                schema['items'] = infer_field(value[0])
-                
-            return schema
+                if not value:
+                    report('empty_object', chain, pattern)
+                properties = schema['properties'] = {}
+                children = []
+                for k, v in value.items():
+                    child_type = type_names.get(type(v)) or json_type(v)
+                    if child_type in containers:
+                        child = properties[k] = {}
+                        children.append((v, child, (chain, k), (pattern, k), depth + 1))
+                    else:
+                        # Scalars are finished inline instead of taking a trip through the stack
+                        properties[k] = {'type': child_type}
+                        if child_type == 'null':
+                            report('null_value', (chain, k), (pattern, k))
+                stack.extend(reversed(children))
+            elif field_type == 'array':
+                if not value:
+                    report('empty_array', chain, pattern)
+                    continue
+                base_type = type(value[0])
+                item_pattern = (pattern, '[*]')
+                element_schemas: List[Dict[str, Any]] = []
+                scalar_schemas: Dict[str, Dict[str, Any]] = {}
+                shape_schemas: Dict[tuple, Dict[str, Any]] = {}
+                children = []
+                for i, element in enumerate(value):
+                    if not isinstance(element, base_type):
+                        report('inconsistent_array_type', (chain, i), item_pattern,
+                               expected=base_type.__name__, found=type(element).__name__)
+                    element_type = type_names.get(type(element)) or json_type(element)
+                    if element_type == 'object' and element:
+                        # Flat records (scalar values only) are grouped by shape, so each
+                        # distinct shape is built and merged once rather than per element
+                        shape = tuple((k, type_names.get(type(v)) or json_type(v)) for k, v in element.items())
+                        if not any(t in containers for _, t in shape):
+                            if shape not in shape_schemas:
+                                shape_schemas[shape] = {
+                                    'type': 'object',
+                                    'properties': {k: {'type': t} for k, t in shape}
+                                }
+                                element_schemas.append(shape_schemas[shape])
+                            for k, t in shape:
+                                if t == 'null':
+                                    report('null_value', ((chain, i), k), (item_pattern, k))
+                            continue
+                    if element_type in containers:
+                        element_schema: Dict[str, Any] = {}
+                        element_schemas.append(element_schema)
+                        children.append((element, element_schema, (chain, i), item_pattern, depth + 1))
+                    else:
+                        # One schema per distinct scalar type is enough to merge
+                        if element_type not in scalar_schemas:
+                            scalar_schemas[element_type] = {'type': element_type}
+                            element_schemas.append(scalar_schemas[element_type])
+                        if element_type == 'null':
+                            report('null_value', (chain, i), item_pattern)
+                stack.append((merge, schema, element_schemas, None, depth))
+                stack.extend(reversed(children))
+            elif field_type == 'null':
+                report('null_value', chain, pattern)
+
+        for (anomaly_type, pattern), count in seen.items():
+            if count > limit:
+                anomalies.append({
+                    'type': 'anomalies_truncated',
+                    'path': render(pattern),
+                    'anomaly': anomaly_type,
+                    'omitted': count - limit
+                })
+        return root, anomalies
 
-        return infer_field(data)
+    @staticmethod
+    def _merge_schema(target: Dict[str, Any], other: Dict[str, Any]) -> None:
+        """Merge `other` into `target` in place (iteratively, so deep schemas are safe)"""
+        stack = [(target, other)]
+        while stack:
+            t, o = stack.pop()
+            if t == o:
+                # Identical shapes (the common case for homogeneous arrays)
+                continue
+            if o.get('nullable'):
+                t['nullable'] = True
+            if t['type'] == o['type']:
+                if t['type'] == 'object':
+                    properties = t['properties']
+                    for k, v in o['properties'].items():
+                        if k in properties:
+                            stack.append((properties[k], v))
+                        else:
+                            properties[k] = v
+                elif t['type'] == 'array' and 'items' in o:
+                    if 'items' in t:
+                        stack.append((t['items'], o['items']))
+                    else:
+                        t['items'] = o['items']
+                elif t['type'] == 'mixed':
+                    t['types'] = sorted(set(t['types']) | set(o['types']))
+            elif o['type'] == 'null':
+                t['nullable'] = True
+            elif t['type'] == 'null':
+                t.clear()
+                t.update(o)
+                t['nullable'] = True
+            elif {t['type'], o['type']} == {'integer', 'number'}:
+                t['type'] = 'number'
+            else:
+                types = set(t.get('types', [t['type']])) | set(o.get('types', [o['type']]))
+                nullable = t.get('nullable')
+                t.clear()
+                t.update({'type': 'mixed', 'types': sorted(types)})
+                if nullable:
+                    t['nullable'] = True
 
     def _validate_data(self, data: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
         """Validate data against the inferred schema"""
-        def create_pydantic_model(schema: Dict[str, Any], name: str = 'DynamicModel') -> BaseModel:
+        try:
+            model = self._get_validator(schema)
+            return model.model_validate(data).model_dump()
+        except ValidationError as e:
+            return {'validation_errors': str(e)}
+
+    @staticmethod
+    def _create_validator(schema: Dict[str, Any]) -> Type[BaseModel]:
+        """Build a pydantic model mirroring the schema's (nested) object properties"""
+        def create_pydantic_model(schema: Dict[str, Any], name: str = 'DynamicModel') -> Type[BaseModel]:
             fields = {}
             for field_name, field_schema in schema.get('properties', {}).items():
                 field_type = field_schema['type']
@@ -117,50 +379,8 @@ class JSONAgent(BaseAgent):
 
             return create_model(name, **fields)
 
-        try:
-            model = create_pydantic_model(schema)
-            return model(**data).dict()
-        except ValidationError as e:
-            return {'validation_errors': str(e)}
+        return create_pydantic_model(schema)
 
-    def _check_anomalies(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _check_anomalies(self, data: Any) -> List[Dict[str, Any]]:
         """Check for potential anomalies in the data"""
-        anomalies = []
-
-        def check_value(value: Any, path: str) -> None:
-            if isinstance(value, dict):
-                # Check for empty objects
-                if not value:
-                    anomalies.append({
-                        'type': 'empty_object',
-                        'path': path
-                    })
-                for k, v in value.items():
-                    check_value(v, f"{path}.{k}" if path else k)
-            elif isinstance(value, list):
-                # Check for empty lists
-                if not value:
-                    anomalies.append({
-                        'type': 'empty_array',
-                        'path': path
-                    })
-                # Check for inconsistent types in arrays
-                if value:
-                    base_type = type(value[0])
-                    for i, item in enumerate(value):
-                        if not isinstance(item, base_type):
-                            anomalies.append({
-                                'type': 'inconsistent_array_type',
-                                'path': f"{path}[{i}]",
-                                'expected': base_type.__name__,
-                                'found': type(item).__name__
-                            })
-            elif value is None:
-                # Flag null values
-                anomalies.append({
-                    'type': 'null_value',
-                    'path': path
-                })
-
-        check_value(data, "")
-        return anomalies 
\ No newline at end of file
+        return self._analyze_json(data)[1]
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Keyword sets are tiers in priority order, e.g. {'high': [...], 'medium': [...]}
+KeywordTiers = Dict[str, Iterable[str]]
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str
+    tier: str
+    start: int
+    end: int
+
+
+def _normalize(keyword: str) -> str:
+    """Lowercase and collapse internal whitespace so 'Please  Respond' == 'please respond'"""
+    return ' '.join(keyword.lower().split())
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Compile keywords into one regex alternation shaped like a trie, so shared
+    prefixes are tested once and matching cost grows with text length rather
+    than with the number of keywords
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def render(node: Dict[str, dict]) -> str:
+        alternatives = [
+            (r'\s+' if char == ' ' else re.escape(char)) + render(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not alternatives:
+            return ''
+        terminal = '' in node
+        if len(alternatives) == 1 and not terminal:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')' + ('?' if terminal else '')
+
+    return render(trie)
+
+
+class KeywordMatcher:
+    """
+    Finds every keyword of every tier in a single regex scan.
+    Keywords match whole words only (case-insensitive), so 'update' does not match 'updated'.
+    A keyword listed in several tiers belongs to the first one.
+    """
+
+    def __init__(self, tiers: KeywordTiers):
+        self.tiers = list(tiers)
+        self._tier_of: Dict[str, str] = {}
+        for tier, keywords in tiers.items():
+            for keyword in keywords:
+                keyword = _normalize(keyword)
+                if keyword:
+                    self._tier_of.setdefault(keyword, tier)
+        # IGNORECASE accepts text whose lower() differs from the keyword (e.g. 'ſ' for 's'),
+        # so matches are looked up by their casefolded form
+        self._keyword_of = {}
+        for keyword in self._tier_of:
+            self._keyword_of.setdefault(keyword.casefold(), keyword)
+        self._rank = {tier: rank for rank, tier in enumerate(self.tiers)}
+        # Identifies the keyword set, e.g. in result cache keys
+        self.fingerprint = hashlib.sha1(
+            json.dumps([self.tiers, sorted(self._tier_of.items())]).encode()
+        ).hexdigest()[:16]
+        self._pattern = None
+        if self._tier_of:
+            self._pattern = re.compile(r'(?<!\w)' + _trie_pattern(self._tier_of) + r'(?!\w)', re.IGNORECASE)
+
+    def __len__(self) -> int:
+        return len(self._tier_of)
+
+    def scan(self, text: str, limit: Optional[int] = None) -> List[KeywordMatch]:
+        """Return all keyword hits in text (only its first `limit` characters if given)"""
+        if self._pattern is None:
+            return []
+        if limit is not None:
+            text = text[:limit]
+        tier_of = self._tier_of
+        keyword_of = self._keyword_of
+        matches = []
+        for m in self._pattern.finditer(text):
+            keyword = _normalize(m.group())
+            if keyword not in tier_of:
+                keyword = keyword_of.get(keyword.casefold())
+                if keyword is None:
+                    continue
+            matches.append(KeywordMatch(keyword, tier_of[keyword], m.start(), m.end()))
+        return matches
+
+    def top_tier(self, matches: Iterable[KeywordMatch], default: str) -> str:
+        """Highest-priority tier among the matches, or default if there are none"""
+        return min((m.tier for m in matches), key=self._rank.__getitem__, default=default)
+
+
+@lru_cache(maxsize=64)
+def _compile(tiers: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> KeywordMatcher:
+    return KeywordMatcher(dict(tiers))
+
+
+def get_keyword_matcher(tiers: KeywordTiers) -> KeywordMatcher:
+    """Return a compiled matcher for these tiers, shared by every caller passing the same keywords"""
+    return _compile(tuple((tier, tuple(keywords)) for tier, keywords in tiers.items()))
@@ -1,97 +1,318 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from base_agent import BaseAgent
-from typing import Dict, Any, Union
-import torch.nn.functional as F
+import asyncio
+import time
+from concurrent.futures import Executor
+from base_agent import AgentOutcome, BaseAgent
+from metrics import collect_spans, count_document, span
+from micro_batcher import MicroBatcher
+from parsed_document import DocumentInput, ParsedDocument
+from inference_backends import DEFAULT_BACKEND, InferenceBackend, get_backend
+from model_registry import DEFAULT_MODEL_NAME, LoadedModel, registry
+from rule_cascade import RuleCascade
+from shared_memory import MemoryBackend
+from typing import Dict, Any, List, Optional, Tuple
 
 class LLMClassifierAgent(BaseAgent):
     INTENT_LABELS = ['invoice', 'rfq', 'complaint', 'regulation', 'unknown']
 
-    def __init__(self):
-        super().__init__()
-        self.model_name = 'distilbert-base-uncased-finetuned-sst-2-english'
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
+    # Leading PDF pages extracted for classification; the agent extracts the rest later
+    PDF_CLASSIFY_PAGES = 2
 
-    def process(self, data: Union[str, bytes], conversation_id: str) -> Dict[str, Any]:
+    def __init__(self, batching: bool = False, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 model_name: str = DEFAULT_MODEL_NAME, memory: Optional[MemoryBackend] = None,
+                 async_memory=None, executor: Optional[Executor] = None, result_cache=None,
+                 backend: str = DEFAULT_BACKEND, num_threads: Optional[int] = None,
+                 rules: bool = True, cascade: Optional[RuleCascade] = None):
+        super().__init__(memory, async_memory, executor, result_cache)
+        # Cheap rules run first; only documents they cannot decide confidently reach the model
+        self.cascade = cascade if cascade is not None else (RuleCascade.from_config() if rules else None)
+        # The model is loaded lazily on first classification and shared
+        # process-wide through the model registry
+        self.model_name = model_name
+        # Inference backend ('eager', 'inference_mode', 'int8' or 'onnx'), built on first use
+        self.backend = backend
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        # Optional background micro-batcher: concurrent process() calls are
+        # grouped into a single forward pass instead of one pass per document
+        self._batcher: Optional[MicroBatcher] = None
+        if batching:
+            self._batcher = MicroBatcher(
+                self._classify_intents_llm,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                name='llm-classifier-batcher'
+            )
+
+    @property
+    def tokenizer(self):
+        return self._loaded().tokenizer
+
+    @property
+    def model(self):
+        return self._loaded().model
+
+    @property
+    def device(self):
+        return self._loaded().device
+
+    def _loaded(self) -> LoadedModel:
+        return registry.get(self.model_name)
+
+    def _backend(self) -> InferenceBackend:
+        return get_backend(self.model_name, self.backend, self.num_threads)
+
+    def preload(self, warmup: bool = True) -> float:
+        """Load (and optionally warm up) the shared model and backend before the first request"""
+        start = time.perf_counter()
+        registry.preload(self.model_name, warmup=False)
+        backend = self._backend()
+        if warmup:
+            backend.warmup()
+        return time.perf_counter() - start
+
+    def process(self, data: DocumentInput, conversation_id: str, use_llm: bool = True) -> Dict[str, Any]:
         """
         Use the LLM to classify the intent of the input text.
+        With use_llm=False only the format and rules are used and the model is never loaded.
         Returns: Dict containing format, intent, and routing decision
         """
-        format_type = self._detect_format(data)
-        content = self._extract_content(data, format_type)
-        intent = self._classify_intent_llm(content)
+        with collect_spans() as spans:
+            outcome = self.analyze(data, use_llm)
+        outcome = self.with_timings(outcome, spans)
+        self.record_outcome(conversation_id, outcome)
+        return outcome.result
+
+    async def aprocess(self, data: DocumentInput, conversation_id: str, use_llm: bool = True) -> Dict[str, Any]:
+        """Async classification: parsing and inference run off the event loop"""
+        with collect_spans() as spans:
+            document = ParsedDocument.of(data)
+            format_type = self._detect_format(document)
+            decided = await self.run_in_executor(self._decide_without_model, document, use_llm)
+            if decided is not None:
+                intent, stage = decided
+            elif not use_llm:
+                intent, stage = 'unknown', self._record_stage('format')
+            else:
+                start = time.perf_counter()
+                content = await self.run_in_executor(self._extract_content, document, format_type)
+                if self._batcher is not None:
+                    with span('classifier.batch_wait'):
+                        intent = await asyncio.wrap_future(self._batcher.submit(content))
+                else:
+                    intent = await self.run_in_executor(self._classify_intent_llm, content)
+                await self.run_in_executor(self._after_model, [document], [intent], time.perf_counter() - start)
+                stage = 'model'
+
+        outcome = self.with_timings(self._classification_outcome(self._build_result(format_type, intent, stage)), spans)
+        await self.arecord_outcome(conversation_id, outcome)
+        return outcome.result
+
+    def analyze(self, data: DocumentInput, use_llm: bool = True) -> AgentOutcome:
+        document = ParsedDocument.of(data)
+        format_type = self._detect_format(document)
+        decided = self._decide_without_model(document, use_llm)
+        if decided is not None:
+            intent, stage = decided
+        elif not use_llm:
+            intent, stage = 'unknown', self._record_stage('format')
+        else:
+            start = time.perf_counter()
+            content = self._extract_content(document, format_type)
+            if self._batcher is not None:
+                # The forward pass runs on the batcher thread and only feeds the histograms
+                with span('classifier.batch_wait'):
+                    intent = self._batcher.submit(content).result()
+            else:
+                intent = self._classify_intent_llm(content)
+            self._after_model([document], [intent], time.perf_counter() - start)
+            stage = 'model'
+
+        return self._classification_outcome(self._build_result(format_type, intent, stage))
+
+    def classify_batch(self, documents: List[DocumentInput],
+                       conversation_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Classify many documents with batched forward passes.
+        If conversation_ids are given, each result is logged and stored in its conversation's context.
+        """
+        if conversation_ids is not None and len(conversation_ids) != len(documents):
+            raise ValueError('conversation_ids must match documents in length')
+
+        documents = [ParsedDocument.of(data) for data in documents]
+        formats = [self._detect_format(document) for document in documents]
+        intents: List[Optional[str]] = [None] * len(documents)
+        stages: List[str] = ['model'] * len(documents)
+        undecided = []
+        for i, document in enumerate(documents):
+            decision = self.cascade.decide(document) if self.cascade is not None else None
+            if decision is not None:
+                intents[i], stages[i] = decision.intent, decision.stage
+            else:
+                undecided.append(i)
+
+        # Only documents the rules could not decide and not seen before go through the model
+        cached = self._lookup_intents([documents[i] for i in undecided])
+        misses = []
+        for i, intent in zip(undecided, cached):
+            if intent is not None:
+                intents[i], stages[i] = intent, 'cache'
+            else:
+                misses.append(i)
+        if self.cascade is not None and len(misses) < len(undecided):
+            self.cascade.record('cache', len(undecided) - len(misses))
+        if misses:
+            start = time.perf_counter()
+            contents = [self._extract_content(documents[i], formats[i]) for i in misses]
+            for i, intent in zip(misses, self._classify_intents_llm(contents)):
+                intents[i] = intent
+            self._after_model([documents[i] for i in misses], [intents[i] for i in misses],
+                              time.perf_counter() - start)
+
+        results = [self._build_result(fmt, intent, stage) for fmt, intent, stage in zip(formats, intents, stages)]
+        for _ in results:
+            count_document(self.__class__.__name__, False)
+        if conversation_ids is not None:
+            for conversation_id, result in zip(conversation_ids, results):
+                self.record_classification(conversation_id, result)
+        return results
+
+    def record_classification(self, conversation_id: str, result: Dict[str, Any]) -> None:
+        """Log a classification result and store it in the conversation's context"""
+        self.record_outcome(conversation_id, self._classification_outcome(result))
+
+    def cache_namespace(self) -> str:
+        # Only the intent is cached; the format is re-sniffed, which costs nothing
+        return f"{self.__class__.__name__}:{self.model_name}:{self.backend}"
+
+    def _lookup_intents(self, documents: List[ParsedDocument]) -> List[Optional[str]]:
+        if self.result_cache is None:
+            return [None] * len(documents)
+        return self.result_cache.get_many(self.cache_namespace(), [document.digest for document in documents])
+
+    def _cached_intent(self, document: ParsedDocument) -> Optional[str]:
+        return self._lookup_intents([document])[0]
+
+    def _decide_without_model(self, document: ParsedDocument, use_cache: bool = True) -> Optional[Tuple[str, str]]:
+        """
+        Try the rule cascade, then the result cache.
+        Returns: (intent, deciding stage), or None if the model is needed
+        """
+        if self.cascade is not None:
+            decision = self.cascade.decide(document)
+            if decision is not None:
+                return decision.intent, decision.stage
+        if use_cache:
+            intent = self._cached_intent(document)
+            if intent is not None:
+                return intent, self._record_stage('cache')
+        return None
+
+    def _record_stage(self, stage: str) -> str:
+        if self.cascade is not None:
+            self.cascade.record(stage)
+        return stage
+
+    def _after_model(self, documents: List[ParsedDocument], intents: List[str], elapsed: float) -> None:
+        """Account for a model pass and cache its intents"""
+        if self.cascade is not None:
+            self.cascade.record('model', len(documents), elapsed)
+        self._store_intents(documents, intents, elapsed / len(documents))
+
+    def _store_intents(self, documents: List[ParsedDocument], intents: List[str], elapsed_each: float) -> None:
+        if self.result_cache is not None:
+            self.result_cache.put_many(self.cache_namespace(), [
+                (document.digest, intent, elapsed_each) for document, intent in zip(documents, intents)
+            ])
 
-        result = {
+    def close(self) -> None:
+        """Stop the background micro-batcher, if any"""
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+
+    def _build_result(self, format_type: str, intent: str, decided_by: str) -> Dict[str, Any]:
+        return {
             'format': format_type,
             'intent': intent,
-            'route_to': self._determine_route(format_type, intent)
+            'route_to': self._determine_route(format_type, intent),
+            # 'rule:<name>', 'cache', 'model' or 'format' (no model requested)
+            'decided_by': decided_by
         }
 
-        # Log the classification
-        self.log_action(
-            conversation_id=conversation_id,
+    def _classification_outcome(self, result: Dict[str, Any]) -> AgentOutcome:
+        # Log the classification and store it in context
+        return AgentOutcome(
+            result=result,
             action='classify_llm',
-            details=result
+            details=result,
+            context_updates={
+                'format': result['format'],
+                'intent': result['intent'],
+                'classification_timestamp': True
+            }
         )
 
-        # Store in context
-        self.update_context(conversation_id, {
-            'format': format_type,
-            'intent': intent,
-            'classification_timestamp': True
-        })
-
-        return result
-
-    def _detect_format(self, data: Union[str, bytes]) -> str:
-        # Same as in ClassifierAgent
-        import json, email
-        if isinstance(data, bytes) and data.startswith(b'%PDF'):
-            return 'pdf'
-        try:
-            if isinstance(data, str):
-                json.loads(data)
-                return 'json'
-        except Exception:
-            pass
-        try:
-            if isinstance(data, str):
-                email.message_from_string(data)
-                return 'email'
-            elif isinstance(data, bytes):
-                email.message_from_bytes(data)
-                return 'email'
-        except:
-            pass
-        return 'unknown'
+    def _detect_format(self, data: DocumentInput) -> str:
+        # Byte-prefix sniffing; nothing is parsed until content is needed
+        return ParsedDocument.of(data).format
+
+    def _extract_content(self, data: DocumentInput, format_type: str) -> str:
+        with span('classifier.extract'):
+            return self._extract_text(ParsedDocument.of(data), format_type)
 
-    def _extract_content(self, data: Union[str, bytes], format_type: str) -> str:
-        # Same as in ClassifierAgent
-        import json, email
+    def _extract_text(self, document: ParsedDocument, format_type: str) -> str:
         if format_type == 'pdf':
-            return ''  # Not supported for now
+            return document.pdf_text(self.PDF_CLASSIFY_PAGES).text
         elif format_type == 'json':
-            json_data = json.loads(data if isinstance(data, str) else data.decode())
-            return str(json_data)
+            try:
+                return str(document.json)
+            except ValueError:
+                return document.text
         elif format_type == 'email':
-            if isinstance(data, bytes):
-                msg = email.message_from_bytes(data)
-            else:
-                msg = email.message_from_string(data)
-            return msg.get_payload()
-        return str(data)
+            return document.email_body.text
+        return document.text
+
+    @staticmethod
+    def _build_prompt(content: str) -> str:
+        return f"Classify the intent of this document: {content[:512]}"
 
     def _classify_intent_llm(self, content: str) -> str:
+        return self._classify_intents_llm([content])[0]
+
+    def _classify_intents_llm(self, contents: List[str]) -> List[str]:
+        """Classify many contents, padding each length bucket only to its own longest prompt"""
+        if not contents:
+            return []
+        backend = self._backend()
+        tokenizer = backend.loaded.tokenizer
         # Use zero-shot approach: pick the label with highest score
-        prompt = f"Classify the intent of this document: {content[:512]}"
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512).to(self.device)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits = outputs.logits
-            probs = F.softmax(logits, dim=-1).cpu().numpy()[0]
+        prompts = [self._build_prompt(content) for content in contents]
+        with span('classifier.tokenize'):
+            encoded = tokenizer(prompts, truncation=True, max_length=512)
+        input_ids = encoded['input_ids']
+        attention_mask = encoded['attention_mask']
+
+        # Sort by token length so each bucket holds similarly sized prompts
+        order = sorted(range(len(prompts)), key=lambda i: len(input_ids[i]))
+        intents: List[str] = [''] * len(prompts)
+        for start in range(0, len(order), self.max_batch_size):
+            bucket = order[start:start + self.max_batch_size]
+            with span('classifier.tokenize'):
+                inputs = tokenizer.pad(
+                    {
+                        'input_ids': [input_ids[i] for i in bucket],
+                        'attention_mask': [attention_mask[i] for i in bucket]
+                    },
+                    padding='longest',
+                    return_tensors=backend.tensor_type
+                )
+            with span('classifier.forward'):
+                probs = backend.predict_proba(inputs)
+            for i, row in zip(bucket, probs):
+                intents[i] = self._intent_from_probs(row)
+        return intents
+
+    def _intent_from_probs(self, probs) -> str:
         # For demonstration, map positive/negative to intents
         # (since distilbert-base-uncased-finetuned-sst-2-english is a sentiment model)
         # You can later fine-tune or swap for a true intent classifier
@@ -106,5 +327,7 @@ class LLMClassifierAgent(BaseAgent):
             return 'json_agent'
         elif format_type == 'email':
             return 'email_agent'
+        elif format_type == 'pdf':
+            return 'pdf_agent'
         else:
             return 'email_agent' 
\ No newline at end of file
@@ -0,0 +1,406 @@
+import asyncio
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import timed
+from shared_memory import (DEFAULT_LOG_ENCODING, DEFAULT_MAX_LOG_ENTRIES, DEFAULT_MEMORY_TTL, MemoryBackend,
+                           MemoryCodec)
+from tracing import get_logger, trace_debug, trace_event
+
+logger = get_logger('memory.local')
+
+
+class InProcessMemory(MemoryCodec, MemoryBackend):
+    """
+    Conversation memory in this process's dicts, for ephemeral single-process pipelines.
+    Values are kept encoded like in Redis, so callers never share mutable state with the store.
+    Expired conversations are dropped when next accessed, and by a sweep every PURGE_INTERVAL
+    seconds for the ones never accessed again (e.g. one conversation per bulk document).
+    """
+
+    # Seconds between sweeps that drop expired conversations
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, ttl: int = DEFAULT_MEMORY_TTL, max_log_entries: int = DEFAULT_MAX_LOG_ENTRIES,
+                 log_encoding: str = DEFAULT_LOG_ENCODING):
+        self._configure_retention(ttl, max_log_entries, log_encoding)
+        self._contexts: Dict[str, Dict[str, str]] = {}
+        self._logs: Dict[str, Deque] = {}
+        # Ordered by last touch; with a single TTL that is also expiry order
+        self._expires_at: 'OrderedDict[str, float]' = OrderedDict()
+        self._last_purge = time.monotonic()
+        self._lock = threading.RLock()
+        trace_event(logger, 'memory.init', backend='in_process', ttl=ttl, max_log_entries=max_log_entries)
+
+    def _touch(self, conversation_id: str) -> None:
+        if self.ttl:
+            now = time.monotonic()
+            self._expires_at[conversation_id] = now + self.ttl
+            self._expires_at.move_to_end(conversation_id)
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._purge_expired(now)
+
+    def _purge_expired(self, now: float) -> None:
+        """Drop every expired conversation; stops at the first one still live"""
+        self._last_purge = now
+        expired = 0
+        while self._expires_at:
+            conversation_id, expires_at = next(iter(self._expires_at.items()))
+            if expires_at > now:
+                break
+            self._drop(conversation_id)
+            expired += 1
+        if expired:
+            trace_event(logger, 'memory.purge', logging.DEBUG, backend='in_process', expired=expired)
+
+    def _expire(self, conversation_id: str) -> None:
+        """Drop a conversation whose TTL has passed (checked lazily on access)"""
+        expires_at = self._expires_at.get(conversation_id)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._drop(conversation_id)
+
+    def _drop(self, conversation_id: str) -> None:
+        self._contexts.pop(conversation_id, None)
+        self._logs.pop(conversation_id, None)
+        self._expires_at.pop(conversation_id, None)
+
+    def _append(self, conversation_id: str, entry) -> int:
+        logs = self._logs.get(conversation_id)
+        if logs is None:
+            logs = self._logs[conversation_id] = deque(maxlen=self.max_log_entries or None)
+        logs.append(entry)
+        return len(logs)
+
+    def _trace_memory_state(self, operation: str, conversation_id: str) -> None:
+        trace_debug(logger, 'memory.state', lambda: {
+            'operation': operation,
+            'conversation_id': conversation_id,
+            'context': self.get_context(conversation_id),
+            'logs': self.get_processing_history(conversation_id)
+        })
+
+    @timed('memory.store_context')
+    def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
+        data['timestamp'] = self._timestamp()
+        with self._lock:
+            self._contexts[conversation_id] = self._encode_fields(data)
+            self._touch(conversation_id)
+        self._trace_memory_state("Store Context", conversation_id)
+
+    @timed('memory.get_context')
+    def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._expire(conversation_id)
+            fields = dict(self._contexts.get(conversation_id, {}))
+        return self._decode_fields(fields) or None
+
+    @timed('memory.get_context_fields')
+    def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(conversation_id)
+            context = self._contexts.get(conversation_id, {})
+            values = {field: context[field] for field in fields if field in context}
+        return self._decode_fields(values)
+
+    @timed('memory.update_context')
+    def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        if not updates:
+            return
+        mapping = self._encode_fields(updates)
+        with self._lock:
+            self._expire(conversation_id)
+            self._contexts.setdefault(conversation_id, {}).update(mapping)
+            self._touch(conversation_id)
+        self._trace_memory_state("Update Context", conversation_id)
+
+    @timed('memory.log_processing')
+    def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
+        entry = self._log_entry(agent, action, details)
+        with self._lock:
+            self._expire(conversation_id)
+            entry_number = self._append(conversation_id, entry)
+            self._touch(conversation_id)
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        self._trace_memory_state("Log Processing", conversation_id)
+
+    @timed('memory.record_step')
+    def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                    context_updates: Optional[Dict[str, Any]] = None) -> None:
+        entry = self._log_entry(agent, action, details)
+        mapping = self._encode_fields(context_updates) if context_updates else None
+        with self._lock:
+            self._expire(conversation_id)
+            entry_number = self._append(conversation_id, entry)
+            if mapping:
+                self._contexts.setdefault(conversation_id, {}).update(mapping)
+            self._touch(conversation_id)
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        self._trace_memory_state("Record Step", conversation_id)
+
+    @timed('memory.get_processing_history')
+    def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._expire(conversation_id)
+            history = list(self._logs.get(conversation_id, ()))
+        return [self._decode_entry(entry) for entry in history]
+
+    @timed('memory.clear_context')
+    def clear_context(self, conversation_id: str) -> None:
+        with self._lock:
+            self._drop(conversation_id)
+        trace_event(logger, 'memory.clear', conversation_id=conversation_id)
+
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS context (conversation_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, '
+    'PRIMARY KEY (conversation_id, field)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, '
+    'entry BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS logs_by_conversation ON logs (conversation_id, id)',
+    'CREATE TABLE IF NOT EXISTS expiry (conversation_id TEXT PRIMARY KEY, expires_at REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS expiry_by_time ON expiry (expires_at)'
+)
+
+_UPSERT_FIELD = ('INSERT INTO context (conversation_id, field, value) VALUES (?, ?, ?) '
+                 'ON CONFLICT (conversation_id, field) DO UPDATE SET value = excluded.value')
+_APPEND_LOG = 'INSERT INTO logs (conversation_id, entry) VALUES (?, ?)'
+_UPSERT_EXPIRY = ('INSERT INTO expiry (conversation_id, expires_at) VALUES (?, ?) '
+                  'ON CONFLICT (conversation_id) DO UPDATE SET expires_at = excluded.expires_at')
+_TRIM_LOGS = ('DELETE FROM logs WHERE conversation_id = ? AND id <= '
+              '(SELECT id FROM logs WHERE conversation_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)')
+_EXPIRED = 'SELECT conversation_id FROM expiry WHERE expires_at <= ?'
+# Run ahead of each write: an expired conversation is dropped before it is written again,
+# as Redis would have evicted it. The expiry row goes last since the others test it
+_DROP_IF_EXPIRED = tuple(
+    f'DELETE FROM {table} WHERE conversation_id = ? AND EXISTS '
+    '(SELECT 1 FROM expiry WHERE conversation_id = ? AND expires_at <= ?)'
+    for table in ('context', 'logs', 'expiry')
+)
+
+
+class SQLiteMemory(MemoryCodec, MemoryBackend):
+    """
+    Conversation memory in a SQLite file (WAL mode) for durable single-node runs.
+    Writes are buffered and committed together, one transaction per batch: when
+    `batch_size` writes are pending, on the first write after the oldest pending one
+    has waited `flush_interval` seconds, before any read (reads always see earlier
+    writes) and on close. There is no background timer, so an idle process keeps its
+    batch until the next write, read, flush() or close(); a crash loses at most the
+    unflushed batch.
+    """
+
+    # Seconds between sweeps that delete expired conversations
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str, ttl: int = DEFAULT_MEMORY_TTL, max_log_entries: int = DEFAULT_MAX_LOG_ENTRIES,
+                 log_encoding: str = DEFAULT_LOG_ENCODING, batch_size: int = 256, flush_interval: float = 0.5):
+        self._configure_retention(ttl, max_log_entries, log_encoding)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Autocommit mode: transactions are opened explicitly per batch.
+        # The timeout covers other processes (e.g. bulk workers) holding the write lock.
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_since = 0.0
+        self._trim: set = set()
+        self._last_purge = 0.0
+        self._lock = threading.RLock()
+        atexit.register(self.close)
+        trace_event(logger, 'memory.init', backend='sqlite', path=path, ttl=ttl, max_log_entries=max_log_entries,
+                    batch_size=batch_size)
+
+    def _queue(self, conversation_id: str, statements: List[Tuple[str, tuple]], touch: bool = True) -> None:
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            if touch and self.ttl:
+                now = time.time()
+                self._pending.extend((sql, (conversation_id, conversation_id, now)) for sql in _DROP_IF_EXPIRED)
+            self._pending.extend(statements)
+            if touch and self.ttl:
+                self._pending.append((_UPSERT_EXPIRY, (conversation_id, now + self.ttl)))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._pending_since >= self.flush_interval):
+                self.flush()
+
+    def flush(self) -> None:
+        """Commit all buffered writes in one transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            trim, self._trim = self._trim, set()
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, params in pending:
+                    self._conn.execute(sql, params)
+                if self.max_log_entries:
+                    for conversation_id in trim:
+                        self._conn.execute(_TRIM_LOGS, (conversation_id, conversation_id, self.max_log_entries))
+                if self.ttl and time.monotonic() - self._last_purge >= self.PURGE_INTERVAL:
+                    self._purge_expired()
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        trace_event(logger, 'sqlite.flush', logging.DEBUG, statements=len(pending))
+
+    def _purge_expired(self) -> None:
+        self._last_purge = time.monotonic()
+        expired = [(row[0],) for row in self._conn.execute(_EXPIRED, (time.time(),))]
+        for table in ('context', 'logs', 'expiry'):
+            self._conn.executemany(f'DELETE FROM {table} WHERE conversation_id = ?', expired)
+
+    def _read(self, conversation_id: str, sql: str, params: tuple) -> list:
+        """Flush, then run a query unless the conversation has expired"""
+        with self._lock:
+            self.flush()
+            if self.ttl:
+                row = self._conn.execute('SELECT expires_at FROM expiry WHERE conversation_id = ?',
+                                         (conversation_id,)).fetchone()
+                if row is not None and row[0] <= time.time():
+                    return []
+            return self._conn.execute(sql, params).fetchall()
+
+    def _trace_memory_state(self, operation: str, conversation_id: str) -> None:
+        trace_debug(logger, 'memory.state', lambda: {
+            'operation': operation,
+            'conversation_id': conversation_id,
+            'context': self.get_context(conversation_id),
+            'logs': self.get_processing_history(conversation_id)
+        })
+
+    @timed('memory.store_context')
+    def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
+        data['timestamp'] = self._timestamp()
+        statements = [('DELETE FROM context WHERE conversation_id = ?', (conversation_id,))]
+        statements.extend((_UPSERT_FIELD, (conversation_id, field, value))
+                          for field, value in self._encode_fields(data).items())
+        self._queue(conversation_id, statements)
+        self._trace_memory_state("Store Context", conversation_id)
+
+    @timed('memory.get_context')
+    def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._read(conversation_id, 'SELECT field, value FROM context WHERE conversation_id = ?',
+                          (conversation_id,))
+        return self._decode_fields(dict(rows)) or None
+
+    @timed('memory.get_context_fields')
+    def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        if not fields:
+            return {}
+        placeholders = ', '.join('?' * len(fields))
+        rows = self._read(conversation_id,
+                          f'SELECT field, value FROM context WHERE conversation_id = ? AND field IN ({placeholders})',
+                          (conversation_id, *fields))
+        return self._decode_fields(dict(rows))
+
+    @timed('memory.update_context')
+    def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        if not updates:
+            return
+        self._queue(conversation_id, [(_UPSERT_FIELD, (conversation_id, field, value))
+                                      for field, value in self._encode_fields(updates).items()])
+        self._trace_memory_state("Update Context", conversation_id)
+
+    @timed('memory.log_processing')
+    def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
+        self._append(conversation_id, agent, action, details, None)
+
+    @timed('memory.record_step')
+    def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                    context_updates: Optional[Dict[str, Any]] = None) -> None:
+        self._append(conversation_id, agent, action, details, context_updates)
+
+    def _append(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                context_updates: Optional[Dict[str, Any]]) -> None:
+        statements = [(_APPEND_LOG, (conversation_id, self._log_entry(agent, action, details)))]
+        if context_updates:
+            statements.extend((_UPSERT_FIELD, (conversation_id, field, value))
+                              for field, value in self._encode_fields(context_updates).items())
+        with self._lock:
+            self._trim.add(conversation_id)
+            self._queue(conversation_id, statements)
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent, action=action)
+        self._trace_memory_state("Record Step", conversation_id)
+
+    @timed('memory.get_processing_history')
+    def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        rows = self._read(conversation_id, 'SELECT entry FROM logs WHERE conversation_id = ? ORDER BY id',
+                          (conversation_id,))
+        return [self._decode_entry(row[0]) for row in rows]
+
+    @timed('memory.clear_context')
+    def clear_context(self, conversation_id: str) -> None:
+        self._queue(conversation_id, [(f'DELETE FROM {table} WHERE conversation_id = ?', (conversation_id,))
+                                      for table in ('context', 'logs', 'expiry')], touch=False)
+        trace_event(logger, 'memory.clear', conversation_id=conversation_id)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+        atexit.unregister(self.close)
+
+    def async_view(self) -> 'AsyncMemoryAdapter':
+        # Reads may flush a batch to disk, so calls leave the event loop
+        return AsyncMemoryAdapter(self, offload=True)
+
+
+class AsyncMemoryAdapter:
+    """
+    The async memory API over a local backend.
+    In-process calls never wait on I/O and run inline; `offload` runs them in a worker thread.
+    """
+
+    def __init__(self, memory: MemoryBackend, offload: bool = False):
+        self.memory = memory
+        self.offload = offload
+
+    async def _call(self, method, *args):
+        if self.offload:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
+        await self._call(self.memory.store_context, conversation_id, data)
+
+    async def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.memory.get_context, conversation_id)
+
+    async def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        return await self._call(self.memory.get_context_fields, conversation_id, fields)
+
+    async def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        await self._call(self.memory.update_context, conversation_id, updates)
+
+    async def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
+        await self._call(self.memory.log_processing, conversation_id, agent, action, details)
+
+    async def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                          context_updates: Optional[Dict[str, Any]] = None) -> None:
+        await self._call(self.memory.record_step, conversation_id, agent, action, details, context_updates)
+
+    async def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        return await self._call(self.memory.get_processing_history, conversation_id)
+
+    async def clear_context(self, conversation_id: str) -> None:
+        await self._call(self.memory.clear_context, conversation_id)
+
+    async def close(self) -> None:
+        await self._call(self.memory.close)
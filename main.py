@@ -0,0 +1,149 @@
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import json
+import logging
+import sys
+import uuid
+from typing import Any, Dict
+
+from email_agent import EmailAgent
+from inference_backends import BACKENDS, DEFAULT_BACKEND
+from json_agent import JSONAgent
+from llm_classifier_agent import LLMClassifierAgent
+from metrics import enable_metrics
+from parsed_document import ParsedDocument
+from result_cache import DEFAULT_TTL_SECONDS, ResultCache
+from rule_cascade import RuleCascade
+from shared_memory import get_shared_memory
+from tracing import configure_logging
+
+
+def print_json_result(result: Dict[str, Any]) -> None:
+    if result.get('status') == 'error':
+        print(f"\nError: {result['error']}")
+        return
+    print("\nValidated Data:")
+    print(json.dumps(result['validated_data'], indent=2))
+    if result['anomalies']:
+        print("\nAnomalies:")
+        for anomaly in result['anomalies']:
+            print(f"  - {anomaly['type']} at {anomaly['path']}")
+
+
+def print_email_result(result: Dict[str, Any]) -> None:
+    if result.get('status') == 'error':
+        print(f"\nError: {result['error']}")
+        return
+    sender = result['sender']
+    communication = result['crm_format']['communication']
+    print("\nEmail Analysis:")
+    print(f"From: {sender['name']} <{sender['email']}>")
+    print(f"Subject: {communication['subject']}")
+    print(f"Urgency: {result['urgency']}")
+    print("\nContent Preview:")
+    print(communication['body'][:200] + '...')
+
+
+def print_pdf_result(result: Dict[str, Any]) -> None:
+    if result.get('status') == 'error':
+        print(f"\nError: {result['error']}")
+        return
+    print("\nPDF Analysis:")
+    print(f"Title: {result['metadata'].get('title', '')}")
+    print(f"Pages: {result['pages_extracted']} of {result['page_count']} extracted"
+          f"{' (truncated)' if result['truncated'] else ''}")
+    if result.get('warning'):
+        print(f"Warning: {result['warning']}")
+    print("\nContent Preview:")
+    print(result['text'][:200] + '...')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Classify and process a document with the agent pipeline')
+    parser.add_argument('file_path', help='Path to a JSON, email or PDF file')
+    parser.add_argument('--no-llm', action='store_true',
+                        help='Route by format only and skip loading the intent model')
+    parser.add_argument('--timing', action='store_true',
+                        help='Print cold-start and per-stage timings')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help='Classifier inference backend (compare them with inference_backends.py)')
+    parser.add_argument('--rules', help='JSON rules config for the fast-path cascade (default: built-in rules)')
+    parser.add_argument('--no-rules', action='store_true', help='Send every document to the model')
+    parser.add_argument('--cache', action='store_true',
+                        help='Reuse results for documents already processed (content-addressed, stored in Redis)')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_TTL_SECONDS, help='Seconds a cached result is kept')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='Trace memory operations (-v) or also dump full conversation state (-vv)')
+    args = parser.parse_args()
+    configure_logging([logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)])
+    if args.timing:
+        # Per-stage spans are recorded in each step's log entry
+        enable_metrics()
+
+    try:
+        # Parsed once; the classifier and the routed agent share the decoded form
+        data = ParsedDocument.from_file(args.file_path)
+    except OSError as e:
+        print(f"Error reading {args.file_path}: {e}")
+        return 1
+
+    # Agents are cheap to construct: the model is loaded on first classification,
+    # and all of them share one memory backend (MEMORY_URL, Redis by default)
+    memory = get_shared_memory()
+    cache = ResultCache(ttl=args.cache_ttl) if args.cache else None
+    cascade = RuleCascade.from_file(args.rules) if args.rules else None
+    classifier = LLMClassifierAgent(memory=memory, result_cache=cache, backend=args.backend,
+                                    rules=not args.no_rules, cascade=cascade)
+    agents = {
+        'json_agent': JSONAgent,
+        'email_agent': EmailAgent
+    }
+    startup = time.perf_counter() - _START
+    conversation_id = str(uuid.uuid4())
+
+    print(f"\nProcessing file: {args.file_path}")
+    print("Classifying input...")
+    stage_start = time.perf_counter()
+    classification = classifier.process(data, conversation_id, use_llm=not args.no_llm)
+    classify_time = time.perf_counter() - stage_start
+    print(f"Detected format: {classification['format']}")
+    print(f"Detected intent: {classification['intent']} (decided by {classification['decided_by']})")
+
+    route = classification['route_to']
+    stage_start = time.perf_counter()
+    if route == 'json_agent':
+        print("\nProcessing with JSON Agent...")
+        result = agents[route](memory, result_cache=cache).process(data, conversation_id)
+        print_json_result(result)
+    elif route == 'pdf_agent':
+        # Imported on demand so other formats never pay for loading pdfminer
+        from pdf_agent import PDFAgent
+
+        print("\nProcessing with PDF Agent...")
+        result = PDFAgent(memory, result_cache=cache).process(data, conversation_id)
+        print_pdf_result(result)
+    else:
+        print("\nProcessing with Email Agent...")
+        result = agents[route](memory, result_cache=cache).process(data, conversation_id)
+        print_email_result(result)
+    agent_time = time.perf_counter() - stage_start
+
+    if args.timing:
+        print("\nTiming:")
+        print(f"  Cold start (imports + agent setup): {startup * 1000:.1f} ms")
+        print(f"  Classification: {classify_time * 1000:.1f} ms")
+        print(f"  Agent processing: {agent_time * 1000:.1f} ms")
+        for entry in memory.get_processing_history(conversation_id):
+            for stage, ms in entry['details'].get('timings_ms', {}).items():
+                print(f"    {entry['agent']} {stage}: {ms:.1f} ms")
+        if cache is not None:
+            stats = cache.stats()
+            print(f"  Cache: hit rate {stats['hit_rate']:.0%}, saved {stats['time_saved'] * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from shared_memory import DEFAULT_REDIS_URL, SharedMemory
+from tracing import configure_logging, get_logger, trace_event
+
+logger = get_logger('memory.compaction')
+
+SUMMARY_AGENT = 'MemoryCompaction'
+SUMMARY_ACTION = 'compacted_logs'
+
+DEFAULT_OLDER_THAN = 24 * 3600
+DEFAULT_KEEP = 10
+
+
+def summarize(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fold log entries into one summary: counts per agent and action, the time span,
+    and each agent's latest details. An earlier summary among the entries is merged in.
+    """
+    agents: Counter = Counter()
+    actions: Counter = Counter()
+    latest: Dict[str, Any] = {}
+    count, first, last = 0, None, None
+    for entry in entries:
+        if entry.get('action') == SUMMARY_ACTION:
+            details = entry['details']
+            agents.update(details['agents'])
+            actions.update(details['actions'])
+            latest.update(details['latest'])
+            count += details['entries']
+            first = first or details['first']
+            last = details['last']
+            continue
+        agents[entry['agent']] += 1
+        actions[entry['action']] += 1
+        latest[entry['agent']] = {key: value for key, value in entry['details'].items() if key != 'timings_ms'}
+        count += 1
+        first = first or entry['timestamp']
+        last = entry['timestamp']
+    return {'entries': count, 'first': first, 'last': last, 'agents': dict(agents),
+            'actions': dict(actions), 'latest': latest}
+
+
+def compact_conversation(memory: SharedMemory, conversation_id: str, cutoff: str, keep: int = DEFAULT_KEEP,
+                         dry_run: bool = False) -> Optional[Dict[str, int]]:
+    """
+    Replace the log entries written before `cutoff` (an ISO timestamp) with one summary entry,
+    always keeping the newest `keep` entries as they are.
+    Returns: entries folded and payload bytes before/after, or None if there was nothing to fold
+    """
+    key = memory._logs_key(conversation_id)
+
+    def fold(pipe) -> Optional[Dict[str, int]]:
+        raw = pipe.lrange(key, 0, -1)
+        old: List[Dict[str, Any]] = []
+        for item in raw[:max(0, len(raw) - keep)]:
+            entry = memory._decode_entry(item)
+            if entry.get('action') != SUMMARY_ACTION and entry['timestamp'] >= cutoff:
+                break
+            old.append(entry)
+        if not any(entry.get('action') != SUMMARY_ACTION for entry in old):
+            return None
+        summary = memory._encode_entry({
+            'timestamp': old[-1]['timestamp'],
+            'agent': SUMMARY_AGENT,
+            'action': SUMMARY_ACTION,
+            'details': summarize(old)
+        })
+        if not dry_run:
+            ttl_ms = pipe.pttl(key)
+            # Appends only touch the tail, but a concurrent trim would shift the head: WATCH retries then
+            pipe.multi()
+            pipe.ltrim(key, len(old), -1)
+            pipe.lpush(key, summary)
+            if ttl_ms > 0:
+                # Folding every entry empties the list, and LPUSH recreates it without a TTL
+                pipe.pexpire(key, ttl_ms)
+        return {
+            'folded': len(old),
+            'bytes_before': sum(len(item) for item in raw[:len(old)]),
+            'bytes_after': len(summary)
+        }
+
+    return memory.log_redis.transaction(fold, key, value_from_callable=True)
+
+
+def compact_all(memory: SharedMemory, older_than: float = DEFAULT_OLDER_THAN, keep: int = DEFAULT_KEEP,
+                match: str = 'logs:*', dry_run: bool = False) -> Dict[str, Any]:
+    """Compact every conversation log matching `match` and report the payload bytes saved"""
+    start = time.perf_counter()
+    cutoff = (datetime.utcnow() - timedelta(seconds=older_than)).isoformat()
+    report = {'conversations': 0, 'compacted': 0, 'entries_folded': 0, 'bytes_before': 0, 'bytes_after': 0}
+    prefix_length = len(memory._logs_key(''))
+    for key in memory.log_redis.scan_iter(match=match, count=500, _type='list'):
+        report['conversations'] += 1
+        folded = compact_conversation(memory, key.decode()[prefix_length:], cutoff, keep, dry_run)
+        if folded is None:
+            continue
+        report['compacted'] += 1
+        report['entries_folded'] += folded['folded']
+        report['bytes_before'] += folded['bytes_before']
+        report['bytes_after'] += folded['bytes_after']
+    report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+    report['dry_run'] = dry_run
+    report['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+    trace_event(logger, 'compaction.done', **report)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Fold old conversation logs into per-conversation summaries')
+    parser.add_argument('--redis-url', default=DEFAULT_REDIS_URL)
+    parser.add_argument('--older-than', type=float, default=DEFAULT_OLDER_THAN,
+                        help='Fold entries older than this many seconds')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='Newest entries always kept per conversation')
+    parser.add_argument('--match', default='logs:*', help='Key pattern of the logs to compact')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be saved without writing')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.verbose:
+        configure_logging(logging.INFO)
+
+    report = compact_all(SharedMemory(args.redis_url), args.older_than, args.keep, args.match, args.dry_run)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
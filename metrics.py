@@ -0,0 +1,251 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Off unless AGENT_METRICS is set or enable_metrics() is called; when off, spans
+# and counters cost one global check
+_enabled = os.environ.get('AGENT_METRICS', '').lower() not in ('', '0', 'false', 'no')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def enable_metrics(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label value"""
+
+    def __init__(self, name: str, description: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float) -> None:
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # bucket counts, then sum and count
+                series = self._series[label_value] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative:g}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-1]:g}')
+            lines.append(f'{self.name}_sum{{{label}}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {values[-1]:g}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label value"""
+
+    def __init__(self, name: str, description: str, label: str):
+        self.name = name
+        self.description = description
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str) -> float:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape(label_value)}"}} {value:g}')
+        return lines
+
+
+class Gauge:
+    """Point-in-time values read from a callback when metrics are rendered"""
+
+    def __init__(self, name: str, description: str, label: str, read: Callable[[], Dict[str, float]]):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for label_value, value in sorted(self.read().items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape(label_value)}"}} {value:g}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def histogram(self, name: str, description: str, label: str) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, description, label))
+
+    def counter(self, name: str, description: str, label: str) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, description, label))
+
+    def gauge(self, name: str, description: str, label: str, read: Callable[[], Dict[str, float]]) -> Gauge:
+        """Register (or replace) a gauge read at exposition time"""
+        gauge = Gauge(name, description, label, read)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        """Prometheus text exposition (version 0.0.4) of every registered metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram('agent_stage_seconds', 'Time spent per processing stage', 'stage')
+DOCUMENTS = registry.counter('agent_documents_total', 'Documents analyzed per agent', 'agent')
+ERRORS = registry.counter('agent_errors_total', 'Documents whose analysis ended in an error, per agent', 'agent')
+CACHE_LOOKUPS = registry.counter('result_cache_lookups_total', 'Result cache lookups by outcome', 'result')
+
+# Stage timings of the unit of work in progress (one document), or None when not collecting
+_spans: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar('agent_spans', default=None)
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.stage, elapsed)
+        spans = _spans.get()
+        if spans is not None:
+            spans[self.stage] = spans.get(self.stage, 0.0) + elapsed
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """Time a block as one stage: observed in the histogram and added to the collecting document"""
+    return _Span(stage) if _enabled else _NOOP_SPAN
+
+
+def timed(stage: str):
+    """Decorator form of span() for sync and async functions"""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _Span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class collect_spans:
+    """
+    Collect the stage timings recorded in this context (and contexts copied from it).
+    The collected dict is None when metrics are disabled.
+    Work handed to another thread (e.g. the micro-batcher) still feeds the
+    histograms but not the collecting document.
+    """
+
+    __slots__ = ('spans', '_token')
+
+    def __enter__(self) -> Optional[Dict[str, float]]:
+        if not _enabled:
+            self.spans = None
+            return None
+        self.spans = {}
+        self._token = _spans.set(self.spans)
+        return self.spans
+
+    def __exit__(self, *exc_info) -> None:
+        if self.spans is not None:
+            _spans.reset(self._token)
+
+
+def timings_ms(spans: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds * 1000, 3) for stage, seconds in spans.items()}
+
+
+def count_document(agent: str, error: bool) -> None:
+    if _enabled:
+        DOCUMENTS.inc(agent)
+        if error:
+            ERRORS.inc(agent)
+
+
+def render_metrics() -> str:
+    return registry.render()
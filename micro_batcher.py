@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Collects concurrent requests and runs them through one batched call.
+
+    Items submitted from any thread are queued; a background worker drains the
+    queue until either `max_batch_size` items are collected or `max_wait_ms`
+    has elapsed since the first item arrived, then hands the whole batch to
+    `batch_fn`. Each caller receives its own result through a Future.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 name: str = 'micro-batcher'):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._closed = False
+        # Makes the closed check and the put atomic, so nothing is queued behind _STOP
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch and return a Future for its result"""
+        future: Future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self._queue.put((item, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush pending items and stop the background worker"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self, first: Tuple[Any, Future]) -> Tuple[List[Tuple[Any, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect(first)
+            self._dispatch(batch)
+        # Nothing can be submitted once closed; fail anything that still reached the queue
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(RuntimeError('batcher closed'))
+
+    def _dispatch(self, batch: List[Tuple[Any, Future]]) -> None:
+        # Drop requests whose callers cancelled while they were queued
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = self.batch_fn(items)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
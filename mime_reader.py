@@ -0,0 +1,147 @@
+import re
+from email.message import Message
+from email.parser import BytesFeedParser
+from email.policy import compat32
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional
+
+# Bytes handed to the feed parser per call
+FEED_CHUNK_BYTES = 64 * 1024
+
+# Encoded bytes kept per text part; the rest is dropped as the part is parsed
+MAX_TEXT_PART_BYTES = 1024 * 1024
+
+# Characters of cleaned body text handed to urgency detection and CRM formatting
+MAX_BODY_CHARS = 64 * 1024
+
+_BODY_TYPES = ('text/plain',)
+
+# Top-posted reply headers; everything from here on is the quoted thread
+_REPLY_HEADER = re.compile(
+    r'^\s*(?:On\b.{0,200}\bwrote:|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,})\s*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# "-- " (RFC 3676) or a mobile footer always starts a signature
+_SIGNATURE_DELIMITER = re.compile(r'^(?:-- ?|Sent from my .*)$', re.IGNORECASE | re.MULTILINE)
+
+# A valediction only counts when it is close to the end of the message
+_VALEDICTION = re.compile(
+    r'^\s*(?:best(?: regards| wishes)?|kind regards|regards|thanks(?: again)?|thank you|cheers|sincerely)\b[,.!]?\s*$',
+    re.IGNORECASE
+)
+VALEDICTION_TAIL_LINES = 6
+
+
+class EmailBody(NamedTuple):
+    text: str
+    attachments: List[Dict[str, Any]]
+    truncated: bool
+
+
+class BoundedMessage(Message):
+    """
+    Message whose non-body parts drop their payload as soon as the parser sets it.
+    Attachments keep only their metadata, and text parts keep at most
+    MAX_TEXT_PART_BYTES of encoded payload, so a 20 MB attachment never stays
+    resident after its part has been read.
+    """
+
+    skipped_bytes = 0
+    truncated = False
+
+    def set_payload(self, payload, charset=None):
+        if isinstance(payload, str):
+            if self.is_attachment_part():
+                self.skipped_bytes = len(payload)
+                payload = ''
+            elif len(payload) > MAX_TEXT_PART_BYTES:
+                # Cut on a line boundary so base64 and quoted-printable still decode
+                cut = payload.rfind('\n', 0, MAX_TEXT_PART_BYTES)
+                payload = payload[:cut + 1 if cut > 0 else MAX_TEXT_PART_BYTES]
+                self.truncated = True
+        super().set_payload(payload, charset)
+
+    def is_attachment_part(self) -> bool:
+        if self.get_content_disposition() == 'attachment':
+            return True
+        return self.get_content_maintype() not in ('text', 'multipart', 'message')
+
+
+def _parser() -> BytesFeedParser:
+    return BytesFeedParser(_factory=BoundedMessage, policy=compat32)
+
+
+def parse_message(raw: bytes) -> Message:
+    """Parse an email from bytes incrementally with bounded payloads"""
+    parser = _parser()
+    view = memoryview(raw)
+    for start in range(0, len(view), FEED_CHUNK_BYTES):
+        parser.feed(view[start:start + FEED_CHUNK_BYTES].tobytes())
+    return parser.close()
+
+
+def parse_message_stream(stream: BinaryIO, head: bytes = b'') -> Message:
+    """Parse an email from a binary stream without reading it into memory first"""
+    parser = _parser()
+    if head:
+        parser.feed(head)
+    for chunk in iter(lambda: stream.read(FEED_CHUNK_BYTES), b''):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def decode_part(part: Message) -> str:
+    """Decode a text part using its declared charset, replacing undecodable bytes"""
+    payload = part.get_payload(decode=True) or b''
+    charset = part.get_content_charset() or 'utf-8'
+    try:
+        return payload.decode(charset, errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+
+def attachment_info(part: Message) -> Dict[str, Any]:
+    return {
+        'filename': part.get_filename(),
+        'content_type': part.get_content_type(),
+        'encoded_size': getattr(part, 'skipped_bytes', 0)
+    }
+
+
+def strip_quotes_and_signature(text: str) -> str:
+    """Remove the quoted reply thread, '>' quoted lines and a trailing signature"""
+    reply = _REPLY_HEADER.search(text)
+    if reply:
+        text = text[:reply.start()]
+    signature = _SIGNATURE_DELIMITER.search(text)
+    if signature:
+        text = text[:signature.start()]
+
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith('>')]
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    for i in non_empty[-VALEDICTION_TAIL_LINES:]:
+        if _VALEDICTION.match(lines[i]):
+            lines = lines[:i]
+            break
+    return '\n'.join(lines).strip()
+
+
+def extract_body(msg: Message, max_chars: int = MAX_BODY_CHARS) -> EmailBody:
+    """Collect the cleaned plain-text body and attachment metadata of a parsed message"""
+    parts: List[str] = []
+    attachments: List[Dict[str, Any]] = []
+    truncated = False
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        if isinstance(part, BoundedMessage) and part.is_attachment_part():
+            attachments.append(attachment_info(part))
+        elif part.get_content_type() in _BODY_TYPES:
+            truncated = truncated or getattr(part, 'truncated', False)
+            parts.append(decode_part(part))
+
+    text = strip_quotes_and_signature('\n'.join(parts))
+    if len(text) > max_chars:
+        text = text[:max_chars]
+        truncated = True
+    return EmailBody(text, attachments, truncated)
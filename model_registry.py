@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+DEFAULT_MODEL_NAME = 'distilbert-base-uncased-finetuned-sst-2-english'
+
+
+class LoadedModel(NamedTuple):
+    tokenizer: Any
+    model: Any
+    device: Any
+
+
+class ModelRegistry:
+    """Process-wide, lazily populated cache of tokenizer/model pairs.
+
+    torch and transformers are only imported when a model is first requested,
+    and every agent instance and worker thread asking for the same model name
+    shares one loaded copy.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, LoadedModel] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, model_name: str = DEFAULT_MODEL_NAME) -> LoadedModel:
+        """Return the shared model, loading it on first use"""
+        loaded = self._models.get(model_name)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+        # Only one thread loads a given model; the others wait and reuse it
+        with load_lock:
+            loaded = self._models.get(model_name)
+            if loaded is None:
+                loaded = self._load(model_name)
+                self._models[model_name] = loaded
+        return loaded
+
+    def register(self, model_name: str, tokenizer: Any, model: Any, device: Optional[Any] = None) -> LoadedModel:
+        """Register an already constructed model under a name"""
+        if device is None:
+            import torch
+            device = torch.device('cpu')
+        model.to(device)
+        model.eval()
+        loaded = LoadedModel(tokenizer, model, device)
+        self._models[model_name] = loaded
+        return loaded
+
+    def is_loaded(self, model_name: str = DEFAULT_MODEL_NAME) -> bool:
+        return model_name in self._models
+
+    def preload(self, model_name: str = DEFAULT_MODEL_NAME, warmup: bool = True) -> float:
+        """
+        Load a model ahead of the first request and optionally run a warm-up pass.
+        Returns: seconds spent loading and warming up
+        """
+        start = time.perf_counter()
+        loaded = self.get(model_name)
+        if warmup:
+            import torch
+            inputs = loaded.tokenizer('warm up', return_tensors='pt').to(loaded.device)
+            with torch.no_grad():
+                loaded.model(**inputs)
+        return time.perf_counter() - start
+
+    def unload(self, model_name: str) -> None:
+        self._models.pop(model_name, None)
+
+    def _load(self, model_name: str) -> LoadedModel:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        model.to(device)
+        model.eval()
+        return LoadedModel(tokenizer, model, device)
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_name: str = DEFAULT_MODEL_NAME) -> LoadedModel:
+    return registry.get(model_name)
+
+
+def preload(model_name: str = DEFAULT_MODEL_NAME, warmup: bool = True) -> float:
+    return registry.preload(model_name, warmup)
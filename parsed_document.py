@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import re
+from email.message import Message
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Union
+
+from mime_reader import EmailBody, extract_body, parse_message, parse_message_stream
+
+if TYPE_CHECKING:
+    from pdf_reader import PDFText
+
+# Bytes inspected to sniff the format; nothing beyond this is read for detection
+SNIFF_BYTES = 1024
+
+# Emails larger than this are parsed straight from the file instead of being read whole
+STREAM_EMAIL_BYTES = 1024 * 1024
+
+# PDFs larger than this are extracted from the file instead of being read whole
+STREAM_PDF_BYTES = 4 * 1024 * 1024
+
+# An RFC 5322 header line ("Name: value") or an mbox "From " separator
+_EMAIL_START = re.compile(rb'^(?:From |[!-9;-~]+:)')
+
+_UNSET = object()
+
+
+def sniff_format(raw: Union[str, bytes]) -> str:
+    """Detect the document format from its first bytes without parsing it"""
+    head = raw[:SNIFF_BYTES]
+    if isinstance(head, str):
+        head = head.encode('utf-8', errors='replace')
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    head = head.lstrip(b'\xef\xbb\xbf').lstrip()
+    if head[:1] in (b'{', b'['):
+        return 'json'
+    if _EMAIL_START.match(head):
+        return 'email'
+    return 'unknown'
+
+
+# Headers added in transit; a re-delivered or retried copy differs only in these
+IGNORED_HEADERS = (
+    'received', 'x-received', 'return-path', 'delivered-to', 'dkim-signature',
+    'arc-seal', 'arc-message-signature', 'arc-authentication-results',
+    'authentication-results', 'received-spf', 'x-original-to'
+)
+
+_HEADER_NAME = re.compile(rb'^([!-9;-~]+):')
+
+
+def _strip_headers(raw: bytes, ignored: Iterable[str]) -> bytes:
+    """Drop the named headers (with their folded continuation lines) from an email's header block"""
+    ignored = {name.encode() for name in ignored}
+    match = re.search(rb'\r?\n\r?\n', raw)
+    head, body = (raw[:match.start()], raw[match.start():]) if match else (raw, b'')
+    kept = []
+    skipping = False
+    for line in head.splitlines():
+        if line[:1] in (b' ', b'\t'):
+            if not skipping:
+                kept.append(line)
+            continue
+        if not kept and line.startswith(b'From '):
+            continue  # mbox envelope line, rewritten on every delivery
+        name = _HEADER_NAME.match(line)
+        skipping = bool(name) and name.group(1).lower() in ignored
+        if not skipping:
+            kept.append(line)
+    return b'\n'.join(kept) + body.replace(b'\r\n', b'\n')
+
+
+def content_digest(raw: Union[str, bytes], format_type: str,
+                   ignored_headers: Iterable[str] = IGNORED_HEADERS) -> str:
+    """
+    SHA-256 of a document's content, normalized so copies that differ only in
+    transport details hash alike: surrounding whitespace, and for emails
+    line endings and the transit headers in ignored_headers
+    """
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8', errors='surrogateescape')
+    raw = raw.strip()
+    if format_type == 'email':
+        raw = _strip_headers(raw, ignored_headers)
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ParsedDocument:
+    """
+    A raw document plus lazily decoded views of it.
+    The JSON tree and email Message are each built at most once and shared by
+    the classifier and whichever agent the document is routed to.
+    """
+
+    def __init__(self, raw: Union[str, bytes]):
+        self.raw = raw
+        self.format = sniff_format(raw)
+        self._json: Any = _UNSET
+        self._message: Any = _UNSET
+        self._text: Any = _UNSET
+        self._email_body: Any = _UNSET
+        self._digest: Any = _UNSET
+        self._pdf: Optional['PDFText'] = None
+        # True when only the head was kept and the message was parsed from a stream
+        self.streamed = False
+        # Source file of a streamed PDF
+        self.path: Optional[str] = None
+
+    @classmethod
+    def of(cls, data: Union[str, bytes, 'ParsedDocument']) -> 'ParsedDocument':
+        return data if isinstance(data, ParsedDocument) else cls(data)
+
+    @classmethod
+    def from_file(cls, file_path: str) -> 'ParsedDocument':
+        with open(file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+            size = os.fstat(f.fileno()).st_size
+            if sniff_format(head) == 'email' and size > STREAM_EMAIL_BYTES:
+                # Only the head is kept as raw; the message is built from the stream
+                document = cls(head)
+                document._message = parse_message_stream(f, head)
+                document.streamed = True
+                return document
+            if sniff_format(head) == 'pdf' and size > STREAM_PDF_BYTES:
+                # Only the head is kept as raw; pages are read from the file as they are extracted
+                document = cls(head)
+                document.path = file_path
+                document.streamed = True
+                return document
+            return cls(head + f.read())
+
+    @property
+    def json(self) -> Any:
+        """Decoded JSON tree; raises json.JSONDecodeError (every time) if the document is not JSON"""
+        if self._json is _UNSET:
+            try:
+                self._json = json.loads(self.raw)
+            except (json.JSONDecodeError, UnicodeDecodeError, RecursionError) as e:
+                # Undecodable bytes and nesting too deep to parse are both "not JSON" to callers
+                if not isinstance(e, json.JSONDecodeError):
+                    e = json.JSONDecodeError(str(e), '', 0)
+                self._json = e
+        if isinstance(self._json, json.JSONDecodeError):
+            raise self._json
+        return self._json
+
+    @property
+    def message(self) -> Message:
+        """Email parsed incrementally; attachment payloads are dropped, only their metadata is kept"""
+        if self._message is _UNSET:
+            raw = self.raw.encode('utf-8', errors='surrogateescape') if isinstance(self.raw, str) else self.raw
+            self._message = parse_message(raw)
+        return self._message
+
+    @property
+    def email_body(self) -> EmailBody:
+        """Charset-decoded plain-text body with quotes and signature stripped, plus attachment metadata"""
+        if self._email_body is _UNSET:
+            self._email_body = extract_body(self.message)
+        return self._email_body
+
+    def pdf_text(self, max_pages: Optional[int] = None, workers: int = 1) -> 'PDFText':
+        """
+        Page-wise PDF text of the first `max_pages` pages (None: every page, up to the limits).
+        Pages already extracted for this document, here or by another ParsedDocument
+        of the same content, are reused and only the missing ones are read.
+        """
+        # pdfminer takes ~100 ms to import; only PDFs pay for it
+        from pdf_reader import MAX_PDF_CHARS, cached_extraction, extract_pdf, remember_extraction
+
+        key = self._pdf_key()
+        pdf = self._pdf or (cached_extraction(key) if key else None)
+        if pdf is None or not (pdf.complete or (max_pages is not None and len(pdf.pages) >= max_pages)):
+            start = len(pdf.pages) if pdf else 0
+            raw = self.raw.encode('utf-8', errors='surrogateescape') if isinstance(self.raw, str) else self.raw
+            more = extract_pdf(
+                self.path or raw, start,
+                None if max_pages is None else max_pages - start,
+                MAX_PDF_CHARS - sum(len(page) for page in pdf.pages) if pdf else MAX_PDF_CHARS,
+                workers
+            )
+            pdf = more._replace(pages=pdf.pages + more.pages) if pdf else more
+            if key:
+                remember_extraction(key, pdf)
+        self._pdf = pdf
+        return pdf if max_pages is None else pdf.first(max_pages)
+
+    def _pdf_key(self) -> Optional[str]:
+        if self.path is not None:
+            stat = os.stat(self.path)
+            return f"{os.path.abspath(self.path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return self.digest
+
+    @property
+    def text(self) -> str:
+        """The document as text (UTF-8, undecodable bytes replaced)"""
+        if self._text is _UNSET:
+            if isinstance(self.raw, bytes):
+                self._text = self.raw.decode('utf-8', errors='replace')
+            else:
+                self._text = self.raw
+        return self._text
+
+    @property
+    def digest(self) -> Any:
+        """Normalized content hash used as the result cache key; None for streamed documents"""
+        if self._digest is _UNSET:
+            self._digest = None if self.streamed else content_digest(self.raw, self.format)
+        return self._digest
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+
+# Anything the agents accept: raw text, raw bytes, or an already parsed document
+DocumentInput = Union[str, bytes, ParsedDocument]
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import Executor
+from typing import Optional
+from base_agent import AgentOutcome, BaseAgent
+from metrics import span
+from parsed_document import DocumentInput, ParsedDocument
+from shared_memory import MemoryBackend
+
+# Processes extracting the pages of one large PDF
+DEFAULT_PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+class PDFAgent(BaseAgent):
+    # Characters of extracted text returned in the result; extraction itself is bounded by MAX_PDF_CHARS
+    TEXT_CHARS = 64 * 1024
+
+    def __init__(self, memory: Optional[MemoryBackend] = None, async_memory=None, executor: Optional[Executor] = None,
+                 result_cache=None, workers: Optional[int] = None):
+        super().__init__(memory, async_memory, executor, result_cache)
+        # Processes extracting one large PDF; 1 keeps extraction in-process
+        self.workers = workers if workers is not None else DEFAULT_PDF_WORKERS
+
+    def cache_namespace(self) -> str:
+        # Only reached for a PDF: pdfminer (~100 ms to import) loads with the first one
+        from pdf_reader import MAX_PDF_CHARS, MAX_PDF_PAGES
+
+        return f"{self.__class__.__name__}:{MAX_PDF_PAGES}:{MAX_PDF_CHARS}:{self.TEXT_CHARS}"
+
+    def analyze(self, data: DocumentInput) -> AgentOutcome:
+        """Extract the text of a PDF page by page, reusing pages the classifier already extracted"""
+        try:
+            with span('pdf.extract'):
+                pdf = ParsedDocument.of(data).pdf_text(workers=self.workers)
+            text = pdf.text
+            has_text = bool(text.strip())
+
+            result = {
+                'metadata': pdf.metadata,
+                'page_count': pdf.page_count,
+                'pages_extracted': len(pdf.pages),
+                'empty_pages': sum(1 for page in pdf.pages if not page.strip()),
+                'truncated': pdf.truncated,
+                'text': text[:self.TEXT_CHARS],
+                'text_truncated': len(text) > self.TEXT_CHARS,
+                # No text layer usually means a scanned document that needs OCR
+                'status': 'success' if has_text else 'warning'
+            }
+            if not has_text:
+                result['warning'] = 'No extractable text; the PDF may be scanned images'
+
+            return AgentOutcome(
+                result=result,
+                action='process_pdf',
+                details={
+                    'title': pdf.metadata.get('title', ''),
+                    'page_count': pdf.page_count,
+                    'pages_extracted': len(pdf.pages),
+                    'chars': len(text),
+                    'truncated': pdf.truncated,
+                    'status': result['status']
+                },
+                context_updates={
+                    'pdf_title': pdf.metadata.get('title', ''),
+                    'pdf_page_count': pdf.page_count,
+                    'processing_status': result['status']
+                }
+            )
+
+        except Exception as e:
+            error_result = {
+                'status': 'error',
+                'error': f'Error processing PDF: {str(e)}'
+            }
+            return AgentOutcome(error_result, 'process_pdf_error', error_result)
@@ -0,0 +1,217 @@
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import PSLiteral
+from pdfminer.utils import decode_text
+
+# Pages extracted per document; later pages are never interpreted
+MAX_PDF_PAGES = int(os.environ.get('PDF_MAX_PAGES', 200))
+
+# Characters of extracted text kept per document; extraction stops at the page that crosses it
+MAX_PDF_CHARS = int(os.environ.get('PDF_MAX_CHARS', 1024 * 1024))
+
+# Smaller extractions stay in-process: a task costs a pickle round trip and a re-parse of the xref
+PARALLEL_MIN_PAGES = 16
+
+# Extracted documents kept for the classifier and agent to share
+PDF_CACHE_SIZE = 32
+
+_INFO_FIELDS = ('Title', 'Author', 'Subject', 'Creator', 'Producer', 'CreationDate')
+
+# A file path (streamed, and cheap to hand to pool workers) or the document bytes
+PDFSource = Union[str, bytes]
+
+
+class PDFText(NamedTuple):
+    pages: List[str]
+    # None until known: not every page tree declares a count
+    page_count: Optional[int]
+    metadata: Dict[str, str]
+    # True when MAX_PDF_PAGES or MAX_PDF_CHARS stopped extraction
+    truncated: bool
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.pages)
+
+    @property
+    def complete(self) -> bool:
+        """Nothing more will be extracted from this document"""
+        return self.truncated or (self.page_count is not None and len(self.pages) >= self.page_count)
+
+    def first(self, pages: int) -> 'PDFText':
+        return self._replace(pages=self.pages[:pages])
+
+
+def _open(source: PDFSource) -> BinaryIO:
+    return open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+
+
+def _decode_info(value) -> str:
+    value = resolve1(value)
+    if isinstance(value, bytes):
+        return decode_text(value)
+    if isinstance(value, PSLiteral):
+        return str(value.name)
+    return str(value)
+
+
+def _document_info(document: PDFDocument) -> Dict[str, str]:
+    metadata = {}
+    for info in document.info:
+        for field in _INFO_FIELDS:
+            if field in info and field.lower() not in metadata:
+                metadata[field.lower()] = _decode_info(info[field]).strip()
+    return metadata
+
+
+def _page_count(document: PDFDocument) -> Optional[int]:
+    count = resolve1(resolve1(document.catalog.get('Pages')) or {}).get('Count')
+    return count if isinstance(count, int) else None
+
+
+def iter_page_texts(fp: BinaryIO, start: int = 0, stop: Optional[int] = None,
+                    document: Optional[PDFDocument] = None) -> Iterator[str]:
+    """
+    Text of pages [start, stop), one page at a time.
+    The file is parsed lazily, so pages after `stop` are never read and
+    only the page being interpreted holds its layout in memory.
+    """
+    document = document or PDFDocument(PDFParser(fp))
+    resources = PDFResourceManager(caching=True)
+    output = io.StringIO()
+    device = TextConverter(resources, output, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resources, device)
+    try:
+        for number, page in enumerate(PDFPage.create_pages(document)):
+            if stop is not None and number >= stop:
+                break
+            if number < start:
+                continue
+            interpreter.process_page(page)
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    finally:
+        device.close()
+
+
+def _extract_range(source: PDFSource, start: int, stop: int, max_chars: int) -> List[str]:
+    """Pool task: pages [start, stop) of one document, stopping once max_chars are extracted"""
+    pages: List[str] = []
+    chars = 0
+    with _open(source) as fp:
+        for text in iter_page_texts(fp, start, stop):
+            pages.append(text)
+            chars += len(text)
+            if chars >= max_chars:
+                break
+    return pages
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # The service process runs many threads (uvicorn, batcher, torch): a forked child can
+            # inherit a lock some other thread held and deadlock, so workers start fresh
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def extract_pdf(source: PDFSource, start: int = 0, max_pages: Optional[int] = None,
+                max_chars: int = MAX_PDF_CHARS, workers: int = 1) -> PDFText:
+    """
+    Extract pages from `start` on: at most `max_pages` of them (None: up to MAX_PDF_PAGES in total)
+    and stopping at the page that brings the text to `max_chars`.
+    With workers > 1, a range of at least PARALLEL_MIN_PAGES pages is split
+    into contiguous slices extracted on a process pool.
+    """
+    with _open(source) as fp:
+        document = PDFDocument(PDFParser(fp))
+        page_count = _page_count(document)
+        metadata = _document_info(document)
+        stop = MAX_PDF_PAGES if max_pages is None else min(MAX_PDF_PAGES, start + max_pages)
+        if page_count is not None:
+            stop = min(stop, page_count)
+
+        pages: List[str] = []
+        chars = 0
+        if workers > 1 and page_count is not None and stop - start >= PARALLEL_MIN_PAGES:
+            pool = _get_pool(workers)
+            step = -(-(stop - start) // workers)
+            futures = [pool.submit(_extract_range, source, first, min(first + step, stop), max_chars)
+                       for first in range(start, stop, step)]
+            slices = [future.result() for future in futures]
+            # Slices are joined in page order, cut at the page that crosses the character limit
+            for text in (text for pages_slice in slices for text in pages_slice):
+                if chars >= max_chars:
+                    break
+                pages.append(text)
+                chars += len(text)
+        else:
+            exhausted = True
+            for text in iter_page_texts(fp, start, stop, document):
+                pages.append(text)
+                chars += len(text)
+                if chars >= max_chars:
+                    exhausted = False
+                    break
+            if page_count is None and exhausted and stop - start > len(pages):
+                # Ran out of pages before the limit: now the count is known
+                page_count = start + len(pages)
+
+    end = start + len(pages)
+    more = page_count is None or end < page_count
+    return PDFText(pages, page_count, metadata, more and (chars >= max_chars or end >= MAX_PDF_PAGES))
+
+
+_cache: "OrderedDict[str, PDFText]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_extraction(key: str) -> Optional[PDFText]:
+    with _cache_lock:
+        pdf = _cache.get(key)
+        if pdf is not None:
+            _cache.move_to_end(key)
+        return pdf
+
+
+def remember_extraction(key: str, pdf: PDFText) -> None:
+    """Keep the most complete extraction of a document for whichever component reads it next"""
+    with _cache_lock:
+        current = _cache.get(key)
+        if current is None or len(pdf.pages) >= len(current.pages):
+            _cache[key] = pdf
+        _cache.move_to_end(key)
+        while len(_cache) > PDF_CACHE_SIZE:
+            _cache.popitem(last=False)
@@ -0,0 +1,130 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from metrics import CACHE_LOOKUPS, timed
+from shared_memory import DEFAULT_REDIS_URL, get_redis_client
+from tracing import get_logger, trace_event
+
+logger = get_logger('cache')
+
+# Bump when agent output changes shape so stale cached results are not replayed
+CACHE_VERSION = 1
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_LOCAL_SIZE = 1024
+
+class ResultCache:
+    """
+    Content-addressed cache of agent results.
+    A local LRU sits in front of Redis (entries expire after `ttl` seconds there),
+    so repeats within one process skip the round trip and repeats across
+    processes or restarts still skip the work.
+    """
+
+    def __init__(self, redis_url: str = DEFAULT_REDIS_URL, ttl: int = DEFAULT_TTL_SECONDS,
+                 local_size: int = DEFAULT_LOCAL_SIZE, client: Optional[redis.Redis] = None):
+        self.redis = client if client is not None else get_redis_client(redis_url)
+        self.ttl = ttl
+        self.local_size = local_size
+        # Entries are kept encoded so every hit hands out a fresh copy
+        self._local: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'stores': 0, 'time_saved': 0.0}
+
+    @staticmethod
+    def _key(namespace: str, digest: str) -> str:
+        return f"result_cache:v{CACHE_VERSION}:{namespace}:{digest}"
+
+    def _remember(self, key: str, entry: Tuple[str, float]) -> None:
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _hit(self, kind: str, elapsed: float) -> None:
+        with self._lock:
+            self._stats[kind] += 1
+            self._stats['time_saved'] += elapsed
+        CACHE_LOOKUPS.inc(kind)
+
+    def get(self, namespace: str, digest: Optional[str]) -> Optional[Any]:
+        """Return the cached value, or None on a miss (or when the document has no digest)"""
+        return self.get_many(namespace, [digest])[0]
+
+    @timed('result_cache.get')
+    def get_many(self, namespace: str, digests: List[Optional[str]]) -> List[Optional[Any]]:
+        """Look up several documents: local LRU first, then one Redis MGET for the rest"""
+        values: List[Optional[Any]] = [None] * len(digests)
+        remote: List[int] = []
+        for i, digest in enumerate(digests):
+            if digest is None:
+                continue
+            key = self._key(namespace, digest)
+            with self._lock:
+                entry = self._local.get(key)
+                if entry is not None:
+                    self._local.move_to_end(key)
+            if entry is not None:
+                values[i] = json.loads(entry[0])
+                self._hit('local_hits', entry[1])
+            else:
+                remote.append(i)
+
+        if remote:
+            keys = [self._key(namespace, digests[i]) for i in remote]
+            for i, key, stored in zip(remote, keys, self.redis.mget(keys)):
+                if stored is None:
+                    continue
+                elapsed, _, encoded = stored.partition(' ')
+                self._remember(key, (encoded, float(elapsed)))
+                values[i] = json.loads(encoded)
+                self._hit('redis_hits', float(elapsed))
+
+        misses = sum(1 for digest, value in zip(digests, values) if digest is not None and value is None)
+        if misses:
+            with self._lock:
+                self._stats['misses'] += misses
+            CACHE_LOOKUPS.inc('misses', misses)
+        return values
+
+    def put(self, namespace: str, digest: Optional[str], value: Any, elapsed: float) -> None:
+        """Store a JSON-serializable result and the seconds it took to compute"""
+        self.put_many(namespace, [(digest, value, elapsed)])
+
+    @timed('result_cache.put')
+    def put_many(self, namespace: str, entries: List[Tuple[Optional[str], Any, float]]) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        stored = 0
+        for digest, value, elapsed in entries:
+            if digest is None:
+                continue
+            key = self._key(namespace, digest)
+            encoded = json.dumps(value)
+            # Stored as "<elapsed seconds> <json>"
+            pipe.set(key, f"{elapsed:.6f} {encoded}", ex=self.ttl)
+            self._remember(key, (encoded, elapsed))
+            stored += 1
+        if stored:
+            pipe.execute()
+            with self._lock:
+                self._stats['stores'] += stored
+            trace_event(logger, 'cache.store', namespace=namespace, entries=stored)
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit counts, hit rate and the compute time skipped thanks to hits"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+        lookups = stats['local_hits'] + stats['redis_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['local_hits'] + stats['redis_hits']) / lookups, 4) if lookups else 0.0
+        stats['time_saved'] = round(stats['time_saved'], 4)
+        return stats
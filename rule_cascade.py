@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher
+from metrics import timed
+from parsed_document import ParsedDocument
+
+# A rule returns (intent, confidence) or None when it has no opinion
+Rule = Callable[[ParsedDocument], Optional[Tuple[str, float]]]
+
+DEFAULT_THRESHOLD = 0.85
+
+# Evidence weights per intent, combined as noisy-OR: 1 - prod(1 - weight)
+DEFAULT_RULES: Dict[str, Any] = {
+    'threshold': DEFAULT_THRESHOLD,
+    'json_keys': {
+        'invoice': {'invoice_number': 0.9, 'invoice_id': 0.9, 'invoice_date': 0.7, 'line_items': 0.6,
+                    'amount_due': 0.6, 'due_date': 0.4, 'total_amount': 0.4, 'items': 0.2, 'total': 0.2},
+        'rfq': {'rfq_number': 0.95, 'rfq_id': 0.95, 'quote_request': 0.9, 'requested_items': 0.6,
+                'quote_deadline': 0.7},
+        'complaint': {'complaint_id': 0.95, 'complaint': 0.8},
+        'regulation': {'regulation_id': 0.95, 'regulation': 0.8, 'compliance_requirements': 0.7}
+    },
+    'email_keywords': {
+        'invoice': ['invoice', 'billing statement', 'payment due', 'amount due'],
+        'rfq': ['rfq', 'request for quote', 'request for quotation', 'quotation request', 'price quote'],
+        'complaint': ['complaint', 'dissatisfied', 'disappointed', 'unacceptable', 'refund'],
+        'regulation': ['regulation', 'regulatory', 'compliance', 'gdpr', 'directive']
+    },
+    # A keyword in the subject is strong evidence; each distinct body keyword is weak
+    'subject_weight': 0.9,
+    'body_weight': 0.35,
+    'body_scan_chars': 2048
+}
+
+
+class Decision(NamedTuple):
+    intent: str
+    confidence: float
+    stage: str
+
+
+def _noisy_or(weights: List[float]) -> float:
+    miss = 1.0
+    for weight in weights:
+        miss *= 1.0 - weight
+    return 1.0 - miss
+
+
+def _best(scores: Dict[str, List[float]]) -> Optional[Tuple[str, float]]:
+    if not scores:
+        return None
+    intent, weights = max(scores.items(), key=lambda item: _noisy_or(item[1]))
+    return intent, _noisy_or(weights)
+
+
+def json_keys_rule(keys: Dict[str, Dict[str, float]]) -> Rule:
+    """Score JSON objects by the top-level keys that identify each intent"""
+    weights_by_key: Dict[str, List[Tuple[str, float]]] = {}
+    for intent, weights in keys.items():
+        for key, weight in weights.items():
+            weights_by_key.setdefault(key, []).append((intent, weight))
+
+    def rule(document: ParsedDocument) -> Optional[Tuple[str, float]]:
+        if document.format != 'json':
+            return None
+        try:
+            data = document.json
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        scores: Dict[str, List[float]] = {}
+        for key in data:
+            for intent, weight in weights_by_key.get(str(key).lower().replace('-', '_'), ()):
+                scores.setdefault(intent, []).append(weight)
+        return _best(scores)
+
+    return rule
+
+
+def email_keywords_rule(keywords: Dict[str, List[str]], subject_weight: float, body_weight: float,
+                        body_scan_chars: int) -> Rule:
+    """Score emails by intent keywords in the subject and the start of the body"""
+    matcher = KeywordMatcher(keywords)
+
+    def rule(document: ParsedDocument) -> Optional[Tuple[str, float]]:
+        if document.format != 'email':
+            return None
+        scores: Dict[str, List[float]] = {}
+        for match in {(m.keyword, m.tier) for m in matcher.scan(document.message.get('subject', '') or '')}:
+            scores.setdefault(match[1], []).append(subject_weight)
+        for match in {(m.keyword, m.tier) for m in matcher.scan(document.email_body.text, body_scan_chars)}:
+            scores.setdefault(match[1], []).append(body_weight)
+        return _best(scores)
+
+    return rule
+
+
+class RuleCascade:
+    """
+    Cheap rules tried in order ahead of the model.
+    The first rule whose confidence clears the threshold decides; anything
+    else is left to the model. Counts which stage decided each document and
+    how long rules and model took, to measure the inference skipped.
+    """
+
+    def __init__(self, rules: List[Tuple[str, Rule]], threshold: float = DEFAULT_THRESHOLD):
+        self.rules = rules
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._decided: Counter = Counter()
+        self._rule_seconds = 0.0
+        self._model_seconds = 0.0
+        self._model_documents = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> 'RuleCascade':
+        """Build the cascade from a rules config; missing entries fall back to DEFAULT_RULES"""
+        config = {**DEFAULT_RULES, **(config or {})}
+        rules: List[Tuple[str, Rule]] = [
+            ('json_keys', json_keys_rule(config['json_keys'])),
+            ('email_keywords', email_keywords_rule(config['email_keywords'], config['subject_weight'],
+                                                   config['body_weight'], config['body_scan_chars']))
+        ]
+        return cls(rules, config['threshold'])
+
+    @classmethod
+    def from_file(cls, file_path: str) -> 'RuleCascade':
+        with open(file_path) as f:
+            return cls.from_config(json.load(f))
+
+    @timed('classifier.rules')
+    def decide(self, document: ParsedDocument) -> Optional[Decision]:
+        """Return the first confident rule decision, or None to defer to the model"""
+        start = time.perf_counter()
+        decision = None
+        for name, rule in self.rules:
+            verdict = rule(document)
+            if verdict is not None and verdict[1] >= self.threshold:
+                decision = Decision(verdict[0], round(verdict[1], 4), f'rule:{name}')
+                break
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._rule_seconds += elapsed
+            if decision is not None:
+                self._decided[decision.stage] += 1
+        return decision
+
+    def record(self, stage: str, documents: int = 1, model_seconds: float = 0.0) -> None:
+        """Count documents decided after the rules (by the result cache or the model)"""
+        with self._lock:
+            self._decided[stage] += documents
+            if stage == 'model':
+                self._model_documents += documents
+                self._model_seconds += model_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decided = dict(self._decided)
+            rule_seconds, model_seconds, model_documents = self._rule_seconds, self._model_seconds, self._model_documents
+        total = sum(decided.values())
+        by_rules = sum(n for stage, n in decided.items() if stage.startswith('rule:'))
+        model_latency = model_seconds / model_documents if model_documents else 0.0
+        return {
+            'documents': total,
+            'decided_by': decided,
+            'skipped_inference_share': round(by_rules / total, 4) if total else 0.0,
+            'rule_seconds': round(rule_seconds, 4),
+            'avg_model_seconds': round(model_latency, 6),
+            # Model time the rule-decided documents would have cost, less the time spent on rules
+            'estimated_time_saved': round(by_rules * model_latency - rule_seconds, 4)
+        }
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response
+
+from base_agent import BaseAgent
+from email_agent import EmailAgent
+from inference_backends import BACKENDS, DEFAULT_BACKEND
+from json_agent import JSONAgent
+from llm_classifier_agent import LLMClassifierAgent
+from metrics import enable_metrics, registry, render_metrics
+from parsed_document import DocumentInput, ParsedDocument
+from pdf_agent import PDFAgent
+from result_cache import DEFAULT_TTL_SECONDS, ResultCache
+from rule_cascade import RuleCascade
+from tracing import configure_logging, get_logger, trace_event
+
+logger = get_logger('service')
+
+
+class Saturated(Exception):
+    """Raised when a stage cannot accept more work"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class AdmissionGate:
+    """
+    Bounded admission for one processing stage.
+    At most `workers` items run at once and at most `max_queue` more may wait;
+    beyond that requests are rejected immediately (429), and a queued request
+    that waits longer than `queue_timeout` seconds is dropped (503).
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(workers)
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def __aenter__(self) -> 'AdmissionGate':
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise Saturated(429, f'{self.name} queue is full')
+        self.in_flight += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.in_flight -= 1
+            self.timed_out += 1
+            raise Saturated(503, f'{self.name} queue wait exceeded {self.queue_timeout}s')
+        except BaseException:
+            # Cancelled while queued (e.g. the client disconnected): give the place back
+            self.in_flight -= 1
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._slots.release()
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
+
+
+class DocumentService:
+    """Runs the classifier -> agent routing with separate inference and agent pools"""
+
+    def __init__(self, inference_workers: int = 1, agent_workers: int = 4, max_queue: int = 64,
+                 queue_timeout: float = 10.0, max_batch_documents: int = 256,
+                 max_document_bytes: int = 10 * 1024 * 1024, batching: bool = True,
+                 result_cache: Optional[ResultCache] = None, backend: str = DEFAULT_BACKEND,
+                 rules: bool = True, cascade: Optional[RuleCascade] = None):
+        self.inference_executor = ThreadPoolExecutor(inference_workers, thread_name_prefix='inference')
+        self.agent_executor = ThreadPoolExecutor(agent_workers, thread_name_prefix='agent')
+        self.result_cache = result_cache
+        self.classifier = LLMClassifierAgent(batching=batching, executor=self.inference_executor,
+                                             result_cache=result_cache, backend=backend,
+                                             rules=rules, cascade=cascade)
+        self.agents: Dict[str, BaseAgent] = {
+            'json_agent': JSONAgent(executor=self.agent_executor, result_cache=result_cache),
+            'email_agent': EmailAgent(executor=self.agent_executor, result_cache=result_cache),
+            'pdf_agent': PDFAgent(executor=self.agent_executor, result_cache=result_cache)
+        }
+        self.inference_workers = inference_workers
+        # With micro-batching, inference concurrency is bounded by batch slots rather than
+        # executor threads: a gate of one would never let a second request join a batch
+        self.inference_slots = inference_workers * self.classifier.max_batch_size if batching else inference_workers
+        self.agent_workers = agent_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_batch_documents = max_batch_documents
+        self.max_document_bytes = max_document_bytes
+        self.inference_gate: Optional[AdmissionGate] = None
+        self.agent_gate: Optional[AdmissionGate] = None
+
+    def start(self) -> None:
+        # Gates hold asyncio primitives, so they are created on the serving loop
+        self.inference_gate = AdmissionGate('inference', self.inference_slots, self.max_queue, self.queue_timeout)
+        self.agent_gate = AdmissionGate('agent', self.agent_workers, self.max_queue, self.queue_timeout)
+        gates = (self.inference_gate, self.agent_gate)
+        registry.gauge('admission_queue_depth', 'Requests waiting for a worker slot', 'stage',
+                       lambda: {gate.name: gate.queued for gate in gates})
+        registry.gauge('admission_in_flight', 'Requests admitted (running or waiting)', 'stage',
+                       lambda: {gate.name: gate.in_flight for gate in gates})
+
+    def shutdown(self) -> None:
+        self.classifier.close()
+        self.inference_executor.shutdown(wait=False, cancel_futures=True)
+        self.agent_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def process_document(self, data: DocumentInput) -> Dict[str, Any]:
+        conversation_id = str(uuid.uuid4())
+        async with self.inference_gate:
+            classification = await self.classifier.aprocess(data, conversation_id)
+        result = await self._run_agent(data, conversation_id, classification)
+        return {'conversation_id': conversation_id, 'classification': classification, 'result': result}
+
+    async def process_batch(self, documents: List[DocumentInput]) -> List[Dict[str, Any]]:
+        conversation_ids = [str(uuid.uuid4()) for _ in documents]
+        # One inference slot and one batched forward pass for the whole request
+        async with self.inference_gate:
+            classifications = await self.classifier.run_in_executor(
+                self.classifier.classify_batch, documents, conversation_ids
+            )
+        # A batch may be larger than the agent queue: it holds at most one gate's worth of
+        # workers at a time and waits for its own slots rather than rejecting itself
+        fan_out = asyncio.Semaphore(self.agent_gate.workers)
+
+        async def run_agent(data: DocumentInput, conversation_id: str, classification: Dict[str, Any]):
+            async with fan_out:
+                return await self._run_agent(data, conversation_id, classification)
+
+        results = await asyncio.gather(*[
+            run_agent(data, conversation_id, classification)
+            for data, conversation_id, classification in zip(documents, conversation_ids, classifications)
+        ], return_exceptions=True)
+
+        response = []
+        for conversation_id, classification, result in zip(conversation_ids, classifications, results):
+            if isinstance(result, Saturated):
+                result = {'status': 'rejected', 'error': result.detail}
+            elif isinstance(result, Exception):
+                raise result
+            response.append({'conversation_id': conversation_id, 'classification': classification, 'result': result})
+        return response
+
+    async def _run_agent(self, data: DocumentInput, conversation_id: str,
+                         classification: Dict[str, Any]) -> Dict[str, Any]:
+        agent = self.agents.get(classification['route_to'], self.agents['email_agent'])
+        async with self.agent_gate:
+            return await agent.aprocess(data, conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'inference': self.inference_gate.stats() if self.inference_gate else None,
+            'agent': self.agent_gate.stats() if self.agent_gate else None
+        }
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.result_cache.stats() if self.result_cache else None
+
+    def cascade_stats(self) -> Optional[Dict[str, Any]]:
+        return self.classifier.cascade.stats() if self.classifier.cascade else None
+
+
+def _saturated_response(e: Saturated) -> HTTPException:
+    trace_event(logger, 'request.rejected', status=e.status_code, reason=e.detail)
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={'Retry-After': '1'})
+
+
+def create_app(service: Optional[DocumentService] = None, preload: bool = False) -> FastAPI:
+    service = service or DocumentService()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        service.start()
+        if preload:
+            await service.classifier.run_in_executor(service.classifier.preload)
+        yield
+        service.shutdown()
+
+    app = FastAPI(title='Multi-Agent Document Processing', lifespan=lifespan)
+    app.state.service = service
+
+    def check_size(raw: bytes) -> None:
+        if len(raw) > service.max_document_bytes:
+            raise HTTPException(status_code=413, detail=f'Document exceeds {service.max_document_bytes} bytes')
+
+    async def read_documents(request: Request) -> List[bytes]:
+        """Read uploaded files from a multipart form, or the raw request body"""
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            form = await request.form()
+            return [await upload.read() for _, upload in form.multi_items() if hasattr(upload, 'read')]
+        return [await request.body()]
+
+    @app.post('/documents')
+    async def process_document(request: Request) -> Dict[str, Any]:
+        documents = await read_documents(request)
+        if len(documents) != 1 or not documents[0]:
+            raise HTTPException(status_code=400, detail='Expected exactly one non-empty document')
+        check_size(documents[0])
+        try:
+            return await service.process_document(ParsedDocument(documents[0]))
+        except Saturated as e:
+            raise _saturated_response(e)
+
+    @app.post('/documents/batch')
+    async def process_batch(request: Request) -> Dict[str, Any]:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            payload = await request.json()
+            if not isinstance(payload, dict) or not isinstance(payload.get('documents', []), list):
+                raise HTTPException(status_code=400, detail="Expected an object with a 'documents' list")
+            documents = [doc.encode() if isinstance(doc, str) else doc for doc in payload.get('documents', [])]
+            if not all(isinstance(doc, bytes) for doc in documents):
+                raise HTTPException(status_code=400, detail="'documents' must be a list of strings")
+        else:
+            documents = await read_documents(request)
+        if not documents:
+            raise HTTPException(status_code=400, detail='No documents supplied')
+        if len(documents) > service.max_batch_documents:
+            raise HTTPException(status_code=413, detail=f'Batch exceeds {service.max_batch_documents} documents')
+        for raw in documents:
+            check_size(raw)
+        try:
+            results = await service.process_batch([ParsedDocument(raw) for raw in documents])
+        except Saturated as e:
+            raise _saturated_response(e)
+        return {'results': results}
+
+    @app.get('/health')
+    async def health() -> Dict[str, Any]:
+        return {
+            'status': 'ok',
+            'queues': service.stats(),
+            'validators': JSONAgent.validator_cache_info(),
+            'result_cache': service.cache_stats(),
+            'cascade': service.cascade_stats()
+        }
+
+    @app.get('/metrics')
+    async def metrics() -> Response:
+        # Prometheus text exposition; stage histograms and counters stay empty unless metrics are enabled
+        return Response(render_metrics(), media_type='text/plain; version=0.0.4')
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='HTTP ingestion service for the agent pipeline')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--inference-workers', type=int, default=1)
+    parser.add_argument('--agent-workers', type=int, default=4)
+    parser.add_argument('--max-queue', type=int, default=64, help='Waiting requests allowed per stage before 429')
+    parser.add_argument('--queue-timeout', type=float, default=10.0, help='Seconds a request may wait before 503')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help='Classifier inference backend')
+    parser.add_argument('--rules', help='JSON rules config for the fast-path cascade (default: built-in rules)')
+    parser.add_argument('--no-rules', action='store_true', help='Send every document to the model')
+    parser.add_argument('--preload', action='store_true', help='Load and warm up the model at startup')
+    parser.add_argument('--cache', action='store_true', help='Reuse results for duplicate documents')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_TTL_SECONDS, help='Seconds a cached result is kept')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Record per-stage timings and counters (served at /metrics, logged per step)')
+    parser.add_argument('--schema-sample', action='append', default=[],
+                        help='JSON file whose schema gets a pre-compiled validator (repeatable)')
+    args = parser.parse_args()
+
+    for sample in args.schema_sample:
+        JSONAgent.register_sample(sample)
+
+    configure_logging()
+    if args.metrics:
+        enable_metrics()
+    service = DocumentService(
+        inference_workers=args.inference_workers,
+        agent_workers=args.agent_workers,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        result_cache=ResultCache(ttl=args.cache_ttl) if args.cache else None,
+        backend=args.backend,
+        rules=not args.no_rules,
+        cascade=RuleCascade.from_file(args.rules) if args.rules else None
+    )
+    uvicorn.run(create_app(service, preload=args.preload), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,98 @@
+from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 import json
+import os
+import threading
+import logging
 import redis
+from metrics import timed
+from tracing import get_logger, trace_debug, trace_event
 
-class SharedMemory:
-    def __init__(self, redis_url: str = 'redis://localhost:6379/0'):
-        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
-        print("\n🔧 Initialized SharedMemory system (Redis-backed)")
+try:
+    import msgpack
+except ImportError:  # optional: only needed for the msgpack log encoding
+    msgpack = None
+
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+
+# Backend chosen by URL scheme: redis:// (or rediss://, unix://), memory:// (in-process)
+# or sqlite:///path/to/file.db
+DEFAULT_MEMORY_URL = os.environ.get('MEMORY_URL', DEFAULT_REDIS_URL)
+
+# Retention defaults, overridable per process through the environment.
+# A TTL or log cap of 0 disables it.
+DEFAULT_MEMORY_TTL = int(os.environ.get('MEMORY_TTL_SECONDS', 7 * 24 * 3600))
+DEFAULT_MAX_LOG_ENTRIES = int(os.environ.get('MEMORY_MAX_LOG_ENTRIES', 1000))
+DEFAULT_LOG_ENCODING = os.environ.get('MEMORY_LOG_ENCODING', 'json')
+LOG_ENCODINGS = ('json', 'msgpack')
+
+_pools: Dict[str, redis.ConnectionPool] = {}
+_shared: Dict[str, 'MemoryBackend'] = {}
+_lock = threading.Lock()
+
+logger = get_logger('memory')
+
+
+def get_redis_client(redis_url: str = DEFAULT_REDIS_URL) -> redis.Redis:
+    """Return a client backed by the process-wide connection pool for redis_url"""
+    with _lock:
+        pool = _pools.get(redis_url)
+        if pool is None:
+            pool = redis.ConnectionPool.from_url(redis_url, decode_responses=True)
+            _pools[redis_url] = pool
+    return redis.Redis(connection_pool=pool)
+
+
+def binary_client(client, client_class=redis.Redis):
+    """A client with the same connection settings as `client` that returns raw bytes"""
+    pool = client.connection_pool
+    kwargs = dict(pool.connection_kwargs, decode_responses=False)
+    if hasattr(pool, 'timeout'):
+        # BlockingConnectionPool
+        kwargs['timeout'] = pool.timeout
+    return client_class(connection_pool=pool.__class__(
+        connection_class=pool.connection_class, max_connections=pool.max_connections, **kwargs
+    ))
+
+
+def open_memory(url: str = DEFAULT_MEMORY_URL) -> 'MemoryBackend':
+    """Create the memory backend for a URL"""
+    scheme, _, location = url.partition('://')
+    if scheme == 'memory':
+        from local_memory import InProcessMemory
+        return InProcessMemory()
+    if scheme == 'sqlite':
+        from local_memory import SQLiteMemory
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteMemory(location[1:] if location.startswith('/') else location)
+    return SharedMemory(url)
+
+
+def get_shared_memory(url: str = DEFAULT_MEMORY_URL) -> 'MemoryBackend':
+    """Return the process-wide memory backend for url, creating it on first use"""
+    with _lock:
+        memory = _shared.get(url)
+    if memory is None:
+        memory = open_memory(url)
+        with _lock:
+            memory = _shared.setdefault(url, memory)
+    return memory
+
+
+class MemoryCodec:
+    """Key layout, value encoding and retention shared by the sync and async memory clients"""
+
+    def _configure_retention(self, ttl: int, max_log_entries: int, log_encoding: str) -> None:
+        if log_encoding not in LOG_ENCODINGS:
+            raise ValueError(f"Unknown log encoding {log_encoding!r}; choose from {LOG_ENCODINGS}")
+        if log_encoding == 'msgpack' and msgpack is None:
+            raise ImportError("The 'msgpack' log encoding needs the msgpack package")
+        # Both keys of a conversation expire `ttl` seconds after its last write
+        self.ttl = ttl
+        # Only the newest `max_log_entries` log entries are kept
+        self.max_log_entries = max_log_entries
+        self.log_encoding = log_encoding
 
     def _context_key(self, conversation_id: str) -> str:
         return f"context:{conversation_id}"
@@ -14,89 +100,268 @@ class SharedMemory:
     def _logs_key(self, conversation_id: str) -> str:
         return f"logs:{conversation_id}"
 
-    def _print_memory_state(self, operation: str, conversation_id: str) -> None:
-        """Print current memory state for traceability"""
-        print(f"\n📝 Memory Operation: {operation}")
-        print(f"🔑 Conversation ID: {conversation_id}")
-        
-        context = self.get_context(conversation_id)
-        if context:
-            print("\n📋 Current Context:")
-            for key, value in context.items():
-                print(f"  - {key}: {value}")
-        
-        history = self.get_processing_history(conversation_id)
-        if history:
-            print("\n📜 Processing Logs:")
-            for log_entry in history:
-                log_entry = json.loads(log_entry)
-                print(f"  - {log_entry['timestamp']} | {log_entry['agent']} | {log_entry['action']}")
-                if 'details' in log_entry:
-                    print(f"    Details: {json.dumps(log_entry['details'], indent=2)}")
+    @staticmethod
+    def _encode_fields(data: Dict[str, Any]) -> Dict[str, str]:
+        return {key: json.dumps(value) for key, value in data.items()}
 
+    @staticmethod
+    def _decode_fields(fields: Dict[Union[str, bytes], Union[str, bytes]]) -> Dict[str, Any]:
+        return {key.decode() if isinstance(key, bytes) else key: json.loads(value) for key, value in fields.items()}
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.utcnow().isoformat()
+
+    def _log_entry(self, agent: str, action: str, details: Dict[str, Any]) -> Union[str, bytes]:
+        return self._encode_entry({
+            'timestamp': self._timestamp(),
+            'agent': agent,
+            'action': action,
+            'details': details
+        })
+
+    def _encode_entry(self, entry: Dict[str, Any]) -> Union[str, bytes]:
+        if self.log_encoding == 'msgpack':
+            return msgpack.packb(entry, use_bin_type=True)
+        return json.dumps(entry, separators=(',', ':'))
+
+    @staticmethod
+    def _decode_entry(raw: Union[str, bytes]) -> Dict[str, Any]:
+        """Decode a log entry in either encoding; JSON entries always start with '{', msgpack maps never do"""
+        if isinstance(raw, bytes) and raw[:1] != b'{':
+            if msgpack is None:
+                raise ImportError('Reading msgpack-encoded log entries needs the msgpack package')
+            return msgpack.unpackb(raw, raw=False)
+        return json.loads(raw)
+
+    def _queue_log_append(self, pipe, conversation_id: str, entry: Union[str, bytes]) -> int:
+        """Queue the append plus trimming and expiry; returns the number of commands queued"""
+        key = self._logs_key(conversation_id)
+        pipe.rpush(key, entry)
+        queued = 1
+        if self.max_log_entries:
+            pipe.ltrim(key, -self.max_log_entries, -1)
+            queued += 1
+        return queued + self._queue_expire(pipe, key)
+
+    def _queue_expire(self, pipe, key: str) -> int:
+        if not self.ttl:
+            return 0
+        pipe.expire(key, self.ttl)
+        return 1
+
+
+class MemoryBackend(ABC):
+    """Conversation context and processing logs, as used by the agents"""
+
+    @abstractmethod
     def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
-        """Store context for a conversation"""
-        data['timestamp'] = datetime.utcnow().isoformat()
-        self.redis.set(self._context_key(conversation_id), json.dumps(data))
-        self._print_memory_state("Store Context", conversation_id)
+        """Store context for a conversation, replacing any existing fields"""
 
+    @abstractmethod
     def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve context for a conversation"""
-        context_json = self.redis.get(self._context_key(conversation_id))
-        print(f"\n🔍 Retrieved context for conversation {conversation_id}")
-        if context_json:
-            context = json.loads(context_json)
-            print(f"  Found {len(context)} context items")
-            return context
-        else:
-            print("  No context found")
-            return None
 
+    @abstractmethod
+    def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        """Retrieve only the named context fields; missing fields are omitted"""
+
+    @abstractmethod
     def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
         """Update existing context with new information"""
-        print(f"\n📝 Updating context for conversation {conversation_id}")
-        print(f"  Updates to apply: {json.dumps(updates, indent=2)}")
-        
-        context = self.get_context(conversation_id) or {}
-        old_context = dict(context)
-        context.update(updates)
-        self.redis.set(self._context_key(conversation_id), json.dumps(context))
-        
-        print("\n  Changes made:")
-        for key, new_value in updates.items():
-            old_value = old_context.get(key, 'NOT_SET')
-            print(f"  - {key}: {old_value} -> {new_value}")
-        self._print_memory_state("Update Context", conversation_id)
 
+    @abstractmethod
     def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
         """Log processing steps for traceability"""
-        print(f"\n📌 Logging processing step:")
-        print(f"  Agent: {agent}")
-        print(f"  Action: {action}")
-        
-        log_entry = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'agent': agent,
-            'action': action,
-            'details': details
-        }
-        self.redis.rpush(self._logs_key(conversation_id), json.dumps(log_entry))
-        print(f"  Added log entry #{self.redis.llen(self._logs_key(conversation_id))}")
-        
-        self._print_memory_state("Log Processing", conversation_id)
 
-    def get_processing_history(self, conversation_id: str) -> list:
+    @abstractmethod
+    def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                    context_updates: Optional[Dict[str, Any]] = None) -> None:
+        """Append a log entry and apply context updates together"""
+
+    @abstractmethod
+    def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """Retrieve processing history for a conversation"""
-        history = self.redis.lrange(self._logs_key(conversation_id), 0, -1)
-        print(f"\n📜 Retrieved processing history for conversation {conversation_id}")
-        print(f"  Found {len(history)} log entries")
-        return history
 
+    @abstractmethod
     def clear_context(self, conversation_id: str) -> None:
         """Clear all data for a conversation"""
-        print(f"\n🗑️ Clearing data for conversation {conversation_id}")
-        
-        self.redis.delete(self._context_key(conversation_id))
-        self.redis.delete(self._logs_key(conversation_id))
-            
-        print("  Cleanup complete") 
\ No newline at end of file
+
+    def async_view(self):
+        """The asyncio counterpart used by BaseAgent.aprocess()"""
+        from local_memory import AsyncMemoryAdapter
+        return AsyncMemoryAdapter(self)
+
+    def flush(self) -> None:
+        """Make buffered writes durable (backends that write through need nothing)"""
+
+    def close(self) -> None:
+        pass
+
+
+class SharedMemory(MemoryCodec, MemoryBackend):
+    """Redis backend, shared by every process pointed at the same server"""
+
+    def __init__(self, redis_url: str = DEFAULT_REDIS_URL, client: Optional[redis.Redis] = None,
+                 ttl: int = DEFAULT_MEMORY_TTL, max_log_entries: int = DEFAULT_MAX_LOG_ENTRIES,
+                 log_encoding: str = DEFAULT_LOG_ENCODING):
+        self.redis_url = redis_url
+        self.redis = client if client is not None else get_redis_client(redis_url)
+        # Log entries may be binary (msgpack), so log lists go through a client that returns bytes
+        self.log_redis = binary_client(self.redis)
+        self._configure_retention(ttl, max_log_entries, log_encoding)
+        trace_event(logger, 'memory.init', backend='redis', ttl=ttl, max_log_entries=max_log_entries,
+                    log_encoding=log_encoding)
+
+    def _trace_memory_state(self, operation: str, conversation_id: str) -> None:
+        """Dump the full conversation state, fetched only when DEBUG tracing is enabled"""
+        def fetch() -> Dict[str, Any]:
+            context, history = self._fetch_state(conversation_id)
+            return {
+                'operation': operation,
+                'conversation_id': conversation_id,
+                'context': context,
+                'logs': [self._decode_entry(entry) for entry in history]
+            }
+        trace_debug(logger, 'memory.state', fetch)
+
+    def _fetch_state(self, conversation_id: str) -> Tuple[Optional[Dict[str, Any]], list]:
+        """Fetch context and processing history in a single round trip"""
+        pipe = self.log_redis.pipeline(transaction=False)
+        pipe.hgetall(self._context_key(conversation_id))
+        pipe.lrange(self._logs_key(conversation_id), 0, -1)
+        context_hash, history = pipe.execute()
+        return self._decode_fields(context_hash) or None, history
+
+    def _migrate_legacy_context(self, key: str) -> None:
+        """Convert a context stored as one JSON string into a hash"""
+        def convert(pipe: redis.client.Pipeline) -> None:
+            if pipe.type(key) != 'string':
+                return
+            context = json.loads(pipe.get(key))
+            pipe.multi()
+            pipe.delete(key)
+            if context:
+                pipe.hset(key, mapping=self._encode_fields(context))
+
+        self.redis.transaction(convert, key)
+        trace_event(logger, 'context.migrate', key=key)
+
+    def _with_hash_context(self, key: str, operation):
+        """Run a hash operation, migrating a pre-hash JSON context on WRONGTYPE"""
+        try:
+            return operation()
+        except redis.ResponseError as e:
+            if 'WRONGTYPE' not in str(e):
+                raise
+            self._migrate_legacy_context(key)
+            return operation()
+
+    def _hset(self, key: str, mapping: Dict[str, str]) -> None:
+        """HSET plus expiry in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        self._queue_expire(pipe, key)
+        pipe.execute()
+
+    @timed('memory.store_context')
+    def store_context(self, conversation_id: str, data: Dict[str, Any]) -> None:
+        """Store context for a conversation, replacing any existing fields"""
+        data['timestamp'] = self._timestamp()
+        key = self._context_key(conversation_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode_fields(data))
+        self._queue_expire(pipe, key)
+        pipe.execute()
+        trace_event(logger, 'context.store', conversation_id=conversation_id, fields=len(data))
+        self._trace_memory_state("Store Context", conversation_id)
+
+    @timed('memory.get_context')
+    def get_context(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve context for a conversation"""
+        key = self._context_key(conversation_id)
+        context = self._decode_fields(self._with_hash_context(key, lambda: self.redis.hgetall(key))) or None
+        trace_event(logger, 'context.get', logging.DEBUG, conversation_id=conversation_id,
+                    found=len(context) if context else 0)
+        return context
+
+    @timed('memory.get_context_fields')
+    def get_context_fields(self, conversation_id: str, fields: List[str]) -> Dict[str, Any]:
+        """Retrieve only the named context fields; missing fields are omitted"""
+        if not fields:
+            return {}
+        key = self._context_key(conversation_id)
+        values = self._with_hash_context(key, lambda: self.redis.hmget(key, fields))
+        context = {field: json.loads(value) for field, value in zip(fields, values) if value is not None}
+        trace_event(logger, 'context.get_fields', logging.DEBUG, conversation_id=conversation_id,
+                    requested=len(fields), found=len(context))
+        return context
+
+    @timed('memory.update_context')
+    def update_context(self, conversation_id: str, updates: Dict[str, Any]) -> None:
+        """Update existing context with new information"""
+        if not updates:
+            return
+        key = self._context_key(conversation_id)
+        # HSET writes only the changed fields in one atomic command, so concurrent
+        # agents updating different fields of a conversation never lose each other's writes
+        mapping = self._encode_fields(updates)
+        self._with_hash_context(key, lambda: self._hset(key, mapping))
+        trace_event(logger, 'context.update', conversation_id=conversation_id, fields=list(updates))
+        self._trace_memory_state("Update Context", conversation_id)
+
+    @timed('memory.log_processing')
+    def log_processing(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any]) -> None:
+        """Log processing steps for traceability"""
+        # RPUSH returns the new list length, so no separate LLEN round trip
+        pipe = self.log_redis.pipeline(transaction=False)
+        self._queue_log_append(pipe, conversation_id, self._log_entry(agent, action, details))
+        entry_number = pipe.execute()[0]
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        self._trace_memory_state("Log Processing", conversation_id)
+
+    @timed('memory.record_step')
+    def record_step(self, conversation_id: str, agent: str, action: str, details: Dict[str, Any],
+                    context_updates: Optional[Dict[str, Any]] = None) -> None:
+        """Append a log entry and apply context updates in one round trip"""
+        pipe = self.log_redis.pipeline(transaction=False)
+        hset_index = self._queue_log_append(pipe, conversation_id, self._log_entry(agent, action, details))
+        if context_updates:
+            pipe.hset(self._context_key(conversation_id), mapping=self._encode_fields(context_updates))
+            self._queue_expire(pipe, self._context_key(conversation_id))
+        results = pipe.execute(raise_on_error=False)
+        if isinstance(results[0], Exception):
+            raise results[0]
+        entry_number = results[0]
+        if context_updates and isinstance(results[hset_index], Exception):
+            if 'WRONGTYPE' not in str(results[hset_index]):
+                raise results[hset_index]
+            key = self._context_key(conversation_id)
+            self._migrate_legacy_context(key)
+            self._hset(key, self._encode_fields(context_updates))
+        trace_event(logger, 'log.append', conversation_id=conversation_id, agent=agent,
+                    action=action, entry=entry_number)
+        if context_updates:
+            trace_event(logger, 'context.update', conversation_id=conversation_id, fields=list(context_updates))
+        self._trace_memory_state("Record Step", conversation_id)
+
+    @timed('memory.get_processing_history')
+    def get_processing_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Retrieve processing history for a conversation, decoded from either log encoding"""
+        history = self.log_redis.lrange(self._logs_key(conversation_id), 0, -1)
+        trace_event(logger, 'log.history', logging.DEBUG, conversation_id=conversation_id,
+                    entries=len(history))
+        return [self._decode_entry(entry) for entry in history]
+
+    @timed('memory.clear_context')
+    def clear_context(self, conversation_id: str) -> None:
+        """Clear all data for a conversation"""
+        self.redis.delete(self._context_key(conversation_id), self._logs_key(conversation_id))
+        trace_event(logger, 'memory.clear', conversation_id=conversation_id)
+
+    def async_view(self):
+        # Async connections are bound to the running loop, so this resolves per loop
+        from async_shared_memory import get_async_shared_memory
+        return get_async_shared_memory(self.redis_url)
@@ -0,0 +1,412 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from inference_backends import BACKENDS, DEFAULT_BACKEND
+from shared_memory import DEFAULT_REDIS_URL, binary_client, get_redis_client, get_shared_memory
+from tracing import configure_logging, get_logger, trace_event
+
+logger = get_logger('streams')
+
+STREAM_PREFIX = 'agents:stream:'
+INGEST_STREAM = f"{STREAM_PREFIX}ingest"
+DONE_STREAM = f"{STREAM_PREFIX}done"
+DEAD_LETTER_STREAM = f"{STREAM_PREFIX}dead"
+# Completion and dead-letter records are capped (approximately); work streams never are
+DONE_MAXLEN = 100_000
+
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_BLOCK_MS = 1000
+# A message unacknowledged for this long is assumed lost with its consumer and reclaimed
+DEFAULT_CLAIM_IDLE_MS = 60_000
+# Deliveries before a message is moved to the dead-letter stream
+DEFAULT_MAX_DELIVERIES = 5
+
+# (stream, fields) to publish when a message is acknowledged
+Output = Tuple[str, Dict[str, Any]]
+Message = Tuple[bytes, Dict[bytes, bytes]]
+
+
+def stream_for(stage: str) -> str:
+    """Work stream consumed by a stage: 'classifier' reads the ingest stream, agents read their route's"""
+    return INGEST_STREAM if stage == 'classifier' else f"{STREAM_PREFIX}{stage}"
+
+
+def get_stream_client(redis_url: str = DEFAULT_REDIS_URL) -> redis.Redis:
+    # Documents travel as raw bytes
+    return binary_client(get_redis_client(redis_url))
+
+
+def submit(client: redis.Redis, document: bytes, conversation_id: Optional[str] = None) -> str:
+    """Queue a document for classification; returns its conversation id"""
+    conversation_id = conversation_id or str(uuid.uuid4())
+    client.xadd(INGEST_STREAM, {'document': document, 'conversation_id': conversation_id})
+    return conversation_id
+
+
+class StreamWorker(ABC):
+    """
+    One consumer in a stage's consumer group.
+    A message is acknowledged (and deleted) in the same MULTI/EXEC that publishes
+    what it produced, so a crash anywhere before that leaves it pending, and
+    another consumer reclaims it with XAUTOCLAIM once it has been idle for
+    `claim_idle_ms`: delivery is at-least-once. A message delivered
+    `max_deliveries` times without success goes to the dead-letter stream.
+    Consumers in a group split the stream between them, so throughput grows
+    with the number of worker processes.
+    """
+
+    def __init__(self, stage: str, client: redis.Redis, consumer: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, block_ms: int = DEFAULT_BLOCK_MS,
+                 claim_idle_ms: int = DEFAULT_CLAIM_IDLE_MS, max_deliveries: int = DEFAULT_MAX_DELIVERIES):
+        self.stage = stage
+        self.stream = stream_for(stage)
+        self.group = stage
+        self.client = client
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self._claim_cursor = '0-0'
+        self._next_claim = 0.0
+        # Last failure per message id, reported if the message ends up dead-lettered
+        self._errors: Dict[bytes, str] = {}
+        self.stats = {'processed': 0, 'failed': 0, 'reclaimed': 0, 'dead_lettered': 0}
+        # Memory backend of the stage's agent; buffered writes are flushed before acknowledging
+        self.memory = None
+        self.ensure_group()
+
+    def ensure_group(self) -> None:
+        try:
+            self.client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @abstractmethod
+    def handle(self, message_id: bytes, fields: Dict[bytes, bytes]) -> List[Output]:
+        """Process one message; raising leaves it pending for redelivery"""
+        pass
+
+    def handle_batch(self, messages: List[Message]) -> Dict[bytes, List[Output]]:
+        """Process a batch; messages missing from the result failed and stay pending"""
+        outputs = {}
+        for message_id, fields in messages:
+            try:
+                outputs[message_id] = self.handle(message_id, fields)
+            except Exception as e:
+                self._fail(message_id, e)
+        return outputs
+
+    def _fail(self, message_id: bytes, error: Exception) -> None:
+        self._errors[message_id] = f"{type(error).__name__}: {error}"
+        self.stats['failed'] += 1
+        trace_event(logger, 'stream.failed', stage=self.stage, message_id=message_id.decode(),
+                    error=self._errors[message_id])
+
+    def _read(self) -> List[Message]:
+        response = self.client.xreadgroup(self.group, self.consumer, {self.stream: '>'},
+                                          count=self.batch_size, block=self.block_ms)
+        return response[0][1] if response else []
+
+    def _reclaim(self) -> List[Message]:
+        """Take over messages other consumers left unacknowledged; dead-letter the ones retried too often"""
+        if time.monotonic() < self._next_claim:
+            return []
+        self._claim_cursor, claimed, _ = self.client.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms, self._claim_cursor, count=self.batch_size
+        )
+        if self._claim_cursor in (b'0-0', '0-0'):
+            # Scanned the whole pending list; look again once more messages may have gone idle
+            self._next_claim = time.monotonic() + self.claim_idle_ms / 2000.0
+        claimed = [(message_id, fields) for message_id, fields in claimed if fields]
+        if not claimed:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for message_id, _ in claimed:
+            pipe.xpending_range(self.stream, self.group, message_id, message_id, 1)
+        deliveries = [pending[0]['times_delivered'] if pending else 0 for pending in pipe.execute()]
+
+        retry, dead = [], []
+        for message, delivered in zip(claimed, deliveries):
+            (dead if delivered > self.max_deliveries else retry).append((message, delivered))
+        if dead:
+            self._dead_letter(dead)
+        self.stats['reclaimed'] += len(retry)
+        trace_event(logger, 'stream.reclaimed', stage=self.stage, retried=len(retry), dead=len(dead))
+        return [message for message, _ in retry]
+
+    def _dead_letter(self, messages: List[Tuple[Message, int]]) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        for (message_id, fields), delivered in messages:
+            record = dict(fields)
+            record.update({
+                'source_stream': self.stream,
+                'source_id': message_id,
+                'deliveries': delivered,
+                'error': self._errors.pop(message_id, 'not acknowledged within the delivery limit')
+            })
+            pipe.xadd(DEAD_LETTER_STREAM, record, maxlen=DONE_MAXLEN, approximate=True)
+        ids = [message_id for (message_id, _), _ in messages]
+        pipe.xack(self.stream, self.group, *ids)
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+        self.stats['dead_lettered'] += len(messages)
+        trace_event(logger, 'stream.dead_letter', stage=self.stage, messages=len(messages))
+
+    def _commit(self, outputs: Dict[bytes, List[Output]]) -> None:
+        """Publish the outputs and acknowledge their messages atomically"""
+        pipe = self.client.pipeline(transaction=True)
+        for produced in outputs.values():
+            for stream, fields in produced:
+                if stream == DONE_STREAM:
+                    pipe.xadd(stream, fields, maxlen=DONE_MAXLEN, approximate=True)
+                else:
+                    pipe.xadd(stream, fields)
+        ids = list(outputs)
+        pipe.xack(self.stream, self.group, *ids)
+        # Acknowledged work is deleted so streams only hold what is still in flight
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+        for message_id in ids:
+            self._errors.pop(message_id, None)
+        self.stats['processed'] += len(ids)
+
+    def run_once(self) -> int:
+        """Reclaim or read one batch and process it; returns the number of messages handled"""
+        messages = self._reclaim() or self._read()
+        if not messages:
+            return 0
+        outputs = self.handle_batch(messages)
+        if outputs:
+            if self.memory is not None:
+                self.memory.flush()
+            self._commit(outputs)
+        return len(messages)
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        trace_event(logger, 'stream.worker_start', stage=self.stage, consumer=self.consumer)
+        try:
+            while stop is None or not stop.is_set():
+                self.run_once()
+        finally:
+            trace_event(logger, 'stream.worker_stop', stage=self.stage, consumer=self.consumer, **self.stats)
+
+
+class ClassifierWorker(StreamWorker):
+    """Classifies ingested documents and publishes each to the stream of the agent it routes to"""
+
+    def __init__(self, client: redis.Redis, classifier, use_llm: bool = True, **options):
+        super().__init__('classifier', client, **options)
+        self.classifier = classifier
+        self.use_llm = use_llm
+        self.memory = classifier.memory
+
+    def _route(self, fields: Dict[bytes, bytes], classification: Dict[str, Any]) -> List[Output]:
+        return [(stream_for(classification['route_to']), {
+            'document': fields[b'document'],
+            'conversation_id': fields[b'conversation_id'],
+            'classification': json.dumps(classification)
+        })]
+
+    def handle(self, message_id: bytes, fields: Dict[bytes, bytes]) -> List[Output]:
+        from parsed_document import ParsedDocument
+
+        classification = self.classifier.process(ParsedDocument(fields[b'document']),
+                                                 fields[b'conversation_id'].decode(), use_llm=self.use_llm)
+        return self._route(fields, classification)
+
+    def handle_batch(self, messages: List[Message]) -> Dict[bytes, List[Output]]:
+        """
+        One batched forward pass per read; a failing batch is retried message by message.
+        The batch is classified without conversation ids and each result is recorded only
+        afterwards, so a retried message never leaves a duplicate log entry behind.
+        """
+        from parsed_document import ParsedDocument
+
+        if not self.use_llm or len(messages) == 1:
+            return super().handle_batch(messages)
+        try:
+            classifications = self.classifier.classify_batch(
+                [ParsedDocument(fields[b'document']) for _, fields in messages]
+            )
+        except Exception as e:
+            trace_event(logger, 'stream.batch_failed', stage=self.stage, messages=len(messages), error=str(e))
+            return super().handle_batch(messages)
+        outputs = {}
+        for (message_id, fields), classification in zip(messages, classifications):
+            try:
+                self.classifier.record_classification(fields[b'conversation_id'].decode(), classification)
+            except Exception as e:
+                self._fail(message_id, e)
+                continue
+            outputs[message_id] = self._route(fields, classification)
+        return outputs
+
+
+class AgentWorker(StreamWorker):
+    """Runs one agent type over its route's stream and records completions on the done stream"""
+
+    def __init__(self, route: str, client: redis.Redis, agent, **options):
+        super().__init__(route, client, **options)
+        self.agent = agent
+        self.memory = agent.memory
+
+    def handle(self, message_id: bytes, fields: Dict[bytes, bytes]) -> List[Output]:
+        from parsed_document import ParsedDocument
+
+        conversation_id = fields[b'conversation_id'].decode()
+        result = self.agent.process(ParsedDocument(fields[b'document']), conversation_id)
+        return [(DONE_STREAM, {
+            'conversation_id': conversation_id,
+            'route': self.stage,
+            'status': result.get('status', 'success')
+        })]
+
+
+def agent_types() -> Dict[str, Any]:
+    from email_agent import EmailAgent
+    from json_agent import JSONAgent
+    from pdf_agent import PDFAgent
+
+    return {'json_agent': JSONAgent, 'email_agent': EmailAgent, 'pdf_agent': PDFAgent}
+
+
+STAGES = ('classifier', 'json_agent', 'email_agent', 'pdf_agent')
+
+
+def build_worker(stage: str, client: redis.Redis, use_llm: bool = True, backend: str = DEFAULT_BACKEND,
+                 result_cache=None, memory=None, **options) -> StreamWorker:
+    if stage == 'classifier':
+        from llm_classifier_agent import LLMClassifierAgent
+
+        classifier = LLMClassifierAgent(memory=memory, result_cache=result_cache, backend=backend)
+        return ClassifierWorker(client, classifier, use_llm=use_llm, **options)
+    agents = agent_types()
+    if stage not in agents:
+        raise ValueError(f"Unknown stage {stage!r}; choose from {STAGES}")
+    return AgentWorker(stage, client, agents[stage](memory=memory, result_cache=result_cache), **options)
+
+
+def stream_status(client: redis.Redis) -> Dict[str, Any]:
+    """Backlog, pending and consumer counts per stage, plus the dead-letter length"""
+    status = {}
+    for stage in STAGES:
+        stream = stream_for(stage)
+        # The stream exists once a worker has created its group or a document was submitted
+        groups = {group['name'].decode(): group for group in client.xinfo_groups(stream)} if client.exists(stream) else {}
+        group = groups.get(stage, {})
+        status[stage] = {
+            'stream': stream,
+            'length': client.xlen(stream),
+            'consumers': group.get('consumers', 0),
+            'pending': group.get('pending', 0),
+            'lag': group.get('lag')
+        }
+    status['dead_letter'] = client.xlen(DEAD_LETTER_STREAM)
+    status['done'] = client.xlen(DONE_STREAM)
+    return status
+
+
+def _run_worker_process(stage: str, redis_url: str, options: Dict[str, Any]) -> None:
+    configure_logging(options.pop('log_level'))
+    cache_ttl = options.pop('cache_ttl')
+    result_cache = None
+    if cache_ttl:
+        from result_cache import ResultCache
+        result_cache = ResultCache(redis_url, ttl=cache_ttl)
+    memory = get_shared_memory(options.pop('memory_url') or redis_url)
+    worker = build_worker(stage, get_stream_client(redis_url), result_cache=result_cache, memory=memory, **options)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        # Unacknowledged messages are reclaimed by the remaining consumers
+        pass
+
+
+def main() -> int:
+    import logging
+
+    parser = argparse.ArgumentParser(description='Distributed classify -> route -> agent workers over Redis Streams')
+    parser.add_argument('--redis-url', default=DEFAULT_REDIS_URL)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker = commands.add_parser('worker', help='Consume one stage')
+    worker.add_argument('--stage', choices=STAGES, required=True)
+    worker.add_argument('--processes', type=int, default=1, help='Consumers to start on this node')
+    worker.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    worker.add_argument('--claim-idle-ms', type=int, default=DEFAULT_CLAIM_IDLE_MS)
+    worker.add_argument('--max-deliveries', type=int, default=DEFAULT_MAX_DELIVERIES)
+    worker.add_argument('--no-llm', action='store_true', help='Classifier routes by format only')
+    worker.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    worker.add_argument('--memory-url', help='Conversation memory (memory://, sqlite:///...); defaults to --redis-url')
+    worker.add_argument('--cache', action='store_true', help='Reuse results for duplicate documents')
+    worker.add_argument('--cache-ttl', type=int, default=24 * 3600)
+    worker.add_argument('-v', '--verbose', action='store_true')
+
+    submit_parser = commands.add_parser('submit', help='Queue documents for classification')
+    submit_parser.add_argument('path', help='File, directory, mbox, maildir or JSON-Lines input')
+    submit_parser.add_argument('--input-format', help='Detected from the path if omitted')
+
+    commands.add_parser('status', help='Show per-stage backlog and the dead-letter length')
+
+    stand_in = commands.add_parser('stand-in', help='Serve an in-memory Redis stand-in for local testing (fakeredis)')
+    stand_in.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args()
+
+    if args.command == 'stand-in':
+        from fakeredis import TcpFakeServer
+
+        print(f"Redis stand-in on redis://127.0.0.1:{args.port}/0", file=sys.stderr)
+        TcpFakeServer(('127.0.0.1', args.port)).serve_forever()
+        return 0
+
+    client = get_stream_client(args.redis_url)
+    if args.command == 'status':
+        print(json.dumps(stream_status(client), indent=2))
+        return 0
+
+    if args.command == 'submit':
+        from bulk_ingest import CONVERSATION_NAMESPACE, detect_input_format, iter_documents
+
+        count = 0
+        for _, doc_id, raw in iter_documents(args.path, args.input_format or detect_input_format(args.path)):
+            # Same ids as bulk_ingest, so resubmitting a source lands in the same conversations
+            submit(client, raw, str(uuid.uuid5(CONVERSATION_NAMESPACE, doc_id)))
+            count += 1
+        print(json.dumps({'submitted': count, 'stream': INGEST_STREAM}))
+        return 0
+
+    options = {
+        'use_llm': not args.no_llm, 'backend': args.backend, 'batch_size': args.batch_size,
+        'claim_idle_ms': args.claim_idle_ms, 'max_deliveries': args.max_deliveries,
+        'cache_ttl': args.cache_ttl if args.cache else None, 'memory_url': args.memory_url,
+        'log_level': logging.INFO if args.verbose else logging.WARNING
+    }
+    processes = [multiprocessing.Process(target=_run_worker_process, args=(args.stage, args.redis_url, dict(options)),
+                                         name=f"{args.stage}-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import json
+import logging
+import sys
+from typing import Any, Callable, Dict, Optional
+
+LOGGER_NAME = 'agents'
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger under the shared 'agents' namespace"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class _Fields:
+    """Formats event fields as compact key=value pairs, only when a record is emitted"""
+
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        parts = []
+        for key, value in self.fields.items():
+            if not isinstance(value, (str, int, float, bool)) and value is not None:
+                value = json.dumps(value, default=str, separators=(',', ':'))
+            parts.append(f"{key}={value}")
+        return ' '.join(parts)
+
+
+def trace_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """Emit a compact structured event; costs one level check when the level is disabled"""
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s', event, _Fields(fields))
+
+
+def trace_debug(logger: logging.Logger, event: str, fetch: Callable[[], Dict[str, Any]]) -> None:
+    """Emit a debug event whose fields are only fetched when DEBUG is enabled"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s %s', event, _Fields(fetch()))
+
+
+def configure_logging(level: int = logging.WARNING, stream: Optional[Any] = None) -> None:
+    """Send 'agents.*' events to a stream (stderr by default) at the given level"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if not any(getattr(h, '_agents_handler', False) for h in logger.handlers):
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        handler._agents_handler = True
+        logger.addHandler(handler)
+    logger.setLevel(level)